@@ -1,26 +1,473 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
+from datetime import datetime, timezone
+import click
+import csv
+import hashlib
+import os
+import tempfile
+from ledger import Ledger, ExpenseError, PoolTimeout
+from money import DEFAULT_CURRENCY, MAX_MINOR, from_minor, to_minor
+from rates import RateTable
+from registry import DuplicateUserError, Registry, RegistryError
+from recurring import RecurringError, RecurringRules
+from feed import ActivityFeed
+from idempotency import MAX_KEY_LENGTH, IdempotencyKeys
+from importer import parse_rows, import_expenses
+from exporter import PARQUET_SUPPORTED, csv_chunks, write_parquet
+from settle import settle, SettleTimeout
 
 app = Flask(__name__)
+app.config['LEDGER_PATH'] = os.getenv(
+    'LEDGER_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ledger.db')
+)
+# Connections each worker process keeps to the ledger, and how long a
+# request waits for one before giving up with a 503
+app.config['LEDGER_POOL_SIZE'] = int(os.getenv('LEDGER_POOL_SIZE', '8'))
+app.config['LEDGER_POOL_TIMEOUT'] = float(os.getenv('LEDGER_POOL_TIMEOUT', '10'))
+# Events between balance snapshots used for point-in-time balance queries
+app.config['LEDGER_SNAPSHOT_INTERVAL'] = int(os.getenv('LEDGER_SNAPSHOT_INTERVAL', '1000'))
+# How often recurring expense rules are materialized (0 disables the
+# scheduler), and how often each worker reloads rules created elsewhere
+app.config['RECURRING_TICK_SECONDS'] = int(os.getenv('RECURRING_TICK_SECONDS', '60'))
+app.config['RECURRING_RESYNC_SECONDS'] = int(os.getenv('RECURRING_RESYNC_SECONDS', '300'))
+# Items kept per group for activity feeds, events loaded into them on
+# startup, and the default feed page size
+app.config['FEED_SIZE'] = int(os.getenv('FEED_SIZE', '200'))
+app.config['FEED_BACKFILL_EVENTS'] = int(os.getenv('FEED_BACKFILL_EVENTS', '10000'))
+app.config['FEED_PAGE_SIZE'] = int(os.getenv('FEED_PAGE_SIZE', '50'))
+# Currency all amounts are recorded and reported in
+app.config['LEDGER_CURRENCY'] = os.getenv('LEDGER_CURRENCY', DEFAULT_CURRENCY)
+# CSV of date,currency,rate used to convert other currencies into LEDGER_CURRENCY
+app.config['RATES_PATH'] = os.getenv('RATES_PATH')
+app.config['RATES_CACHE_SIZE'] = int(os.getenv('RATES_CACHE_SIZE', '4096'))
+# Default and maximum page sizes for GET /expenses
+app.config['EXPENSES_PAGE_SIZE'] = int(os.getenv('EXPENSES_PAGE_SIZE', '50'))
+app.config['EXPENSES_MAX_PAGE_SIZE'] = int(os.getenv('EXPENSES_MAX_PAGE_SIZE', '500'))
+# Rows per transaction for POST /expenses/bulk, and how many row errors to list
+app.config['BULK_BATCH_SIZE'] = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+app.config['BULK_MAX_ERRORS'] = int(os.getenv('BULK_MAX_ERRORS', '1000'))
+# Rows fetched per query (and per Parquet row group) when exporting
+app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+# How long Idempotency-Key responses are kept, and how many each worker
+# holds in memory
+app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+app.config['IDEMPOTENCY_CACHE_SIZE'] = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+# Upper bound on how long /settle may spend solving, in milliseconds
+app.config['SETTLE_TIME_BUDGET_MS'] = int(os.getenv('SETTLE_TIME_BUDGET_MS', '200'))
+# Groups with at most this many unsettled users get the exact solver
+app.config['SETTLE_EXACT_MAX_USERS'] = int(os.getenv('SETTLE_EXACT_MAX_USERS', '12'))
 
-# Sample in-memory data storage
-users = []
-expenses = []
+# Expenses are persisted in SQLite so they survive restarts
+rates = RateTable(
+    app.config['LEDGER_CURRENCY'],
+    path=app.config['RATES_PATH'],
+    cache_size=app.config['RATES_CACHE_SIZE']
+)
+ledger = Ledger(
+    app.config['LEDGER_PATH'],
+    currency=app.config['LEDGER_CURRENCY'],
+    rates=rates,
+    pool_size=app.config['LEDGER_POOL_SIZE'],
+    snapshot_interval=app.config['LEDGER_SNAPSHOT_INTERVAL']
+)
+registry = Registry(ledger)
+feed = ActivityFeed(
+    ledger,
+    size=app.config['FEED_SIZE'],
+    backfill=app.config['FEED_BACKFILL_EVENTS']
+)
+ledger.listeners.append(feed.catch_up)
+idempotency = IdempotencyKeys(
+    ledger,
+    ttl_seconds=app.config['IDEMPOTENCY_TTL_SECONDS'],
+    max_entries=app.config['IDEMPOTENCY_CACHE_SIZE']
+)
+
+@app.before_request
+def checkout_connection():
+    ledger.checkout(timeout=app.config['LEDGER_POOL_TIMEOUT'])
+
+@app.teardown_request
+def checkin_connection(exc):
+    ledger.checkin()
+
+@app.errorhandler(PoolTimeout)
+def pool_exhausted(e):
+    return jsonify({'error': 'Server busy, please retry'}), 503
+
+def _money(minor):
+    """Format a minor-unit amount in the ledger currency"""
+    return from_minor(minor, ledger.currency)
+
+def _validate_expense(data):
+    """Normalize an expense and check its users and group against the registry"""
+    expense = ledger.normalize(data)
+    registry.check_expense(expense)
+    return expense
+
+recurring = RecurringRules(
+    ledger,
+    validate=_validate_expense,
+    resync_seconds=app.config['RECURRING_RESYNC_SECONDS']
+)
+if app.config['RECURRING_TICK_SECONDS'] > 0:
+    recurring.start(app.config['RECURRING_TICK_SECONDS'])
 
 @app.route('/register', methods=['POST'])
 def register_user():
-    data = request.json
-    users.append(data)
-    return jsonify({'message': 'User registered successfully!'}), 201
+    try:
+        user = registry.register_user(request.get_json(silent=True))
+    except DuplicateUserError as e:
+        return jsonify({'error': str(e)}), 409
+    except RegistryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'message': 'User registered successfully!', 'id': user['id']}), 201
+
+@app.route('/users/<user_id>', methods=['GET'])
+def get_user(user_id):
+    user = registry.get_user(user_id)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(user), 200
+
+@app.route('/groups', methods=['POST'])
+def create_group():
+    data = request.get_json(silent=True) or {}
+    try:
+        group = registry.create_group(data.get('name'), data.get('members') or [])
+    except RegistryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(group), 201
+
+@app.route('/groups/<group_id>', methods=['GET'])
+def get_group(group_id):
+    group = registry.get_group(group_id)
+    if group is None:
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify(group), 200
+
+@app.route('/groups/<group_id>/members', methods=['POST'])
+def add_group_members(group_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        registry.add_members(group_id, data.get('members') or [])
+    except RegistryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(registry.get_group(group_id)), 200
+
+def _feed_page(groups):
+    """Serve one page of activity for some groups from the feed buffers"""
+    try:
+        limit = int(request.args.get('limit', app.config['FEED_PAGE_SIZE']))
+        before = int(request.args['before']) if 'before' in request.args else None
+        after = int(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameter'}), 400
+    limit = max(1, min(limit, app.config['FEED_SIZE']))
+    items, next_cursor = feed.page(groups, limit=limit, before=before, after=after)
+    return jsonify({
+        'data': items,
+        'meta': {'limit': limit, 'next_cursor': next_cursor}
+    }), 200
+
+@app.route('/groups/<group_id>/activity', methods=['GET'])
+def get_group_activity(group_id):
+    if registry.get_group(group_id) is None:
+        return jsonify({'error': 'Group not found'}), 404
+    return _feed_page([group_id])
+
+@app.route('/users/<user_id>/activity', methods=['GET'])
+def get_user_activity(user_id):
+    if registry.get_user(user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+    return _feed_page(registry.groups_for(user_id))
+
+@app.route('/groups/<group_id>/export', methods=['GET'])
+def export_group(group_id):
+    if registry.get_group(group_id) is None:
+        return jsonify({'error': 'Group not found'}), 404
+    fmt = request.args.get('format', 'csv')
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    if fmt == 'csv':
+        # Rows are generated page by page while the response is sent
+        return Response(
+            stream_with_context(csv_chunks(ledger, group_id, batch_size)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=group-{group_id}.csv'}
+        )
+    if fmt == 'parquet':
+        if not PARQUET_SUPPORTED:
+            return jsonify({'error': 'Parquet export is not available on this server'}), 501
+        # Parquet writes its footer last, so build the file on disk first
+        sink = tempfile.TemporaryFile()
+        write_parquet(ledger, group_id, sink, batch_size)
+        sink.seek(0)
+        return send_file(
+            sink,
+            mimetype='application/vnd.apache.parquet',
+            as_attachment=True,
+            download_name=f'group-{group_id}.parquet'
+        )
+    return jsonify({'error': 'format must be csv or parquet'}), 400
+
+def _replay(entry, fingerprint):
+    """Answer a retried request from its stored response"""
+    if entry['fingerprint'] != fingerprint:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+    response = app.response_class(entry['body'], status=entry['status'], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
 
 @app.route('/add_expense', methods=['POST'])
 def add_expense():
-    data = request.json
-    expenses.append(data)
-    return jsonify({'message': 'Expense added successfully!'}), 201
+    key = request.headers.get('Idempotency-Key')
+    data = request.get_json(silent=True)
+    if key is None:
+        try:
+            expense = ledger.add_expenses([_validate_expense(data)])[0]
+        except ExpenseError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'message': 'Expense added successfully!', 'id': expense['id']}), 201
+
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        return jsonify({'error': f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters'}), 400
+    fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+    with idempotency.claim(key):
+        entry = idempotency.get(key)
+        if entry is not None:
+            return _replay(entry, fingerprint)
+        try:
+            expense = _validate_expense(data)
+        except ExpenseError as e:
+            return jsonify({'error': str(e)}), 400
+        response = None
+        with ledger.write() as conn:
+            # Another worker may have recorded the key since we looked
+            conn.execute('BEGIN IMMEDIATE')
+            entry = idempotency.lookup(conn, key)
+            if entry is None:
+                ledger.record_expenses(conn, [expense])
+                response = jsonify({'message': 'Expense added successfully!', 'id': expense['id']})
+                entry = idempotency.store(conn, key, fingerprint, 201, response.get_data(as_text=True))
+        idempotency.remember(key, entry)
+    if response is None:
+        return _replay(entry, fingerprint)
+    return response, 201
+
+@app.route('/expenses/bulk', methods=['POST'])
+def bulk_import_expenses():
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    # Rows are parsed straight off the request stream and committed in
+    # batches, so the upload is never held in memory as a whole.
+    rows = parse_rows(request.stream, fmt)
+    try:
+        report = import_expenses(
+            ledger, rows,
+            batch_size=app.config['BULK_BATCH_SIZE'],
+            max_errors=app.config['BULK_MAX_ERRORS'],
+            validate=_validate_expense
+        )
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f'Could not parse upload: {e}'}), 400
+    status = 201 if report['imported'] else 400
+    return jsonify(report), status
+
+@app.route('/expenses/<int:expense_id>', methods=['PUT'])
+def update_expense(expense_id):
+    data = request.get_json(silent=True)
+    try:
+        expense = ledger.update_expense(expense_id, _validate_expense(data))
+    except ExpenseError as e:
+        return jsonify({'error': str(e)}), 400
+    if expense is None:
+        return jsonify({'error': 'Expense not found'}), 404
+    return jsonify(expense), 200
+
+@app.route('/expenses/<int:expense_id>', methods=['DELETE'])
+def delete_expense(expense_id):
+    if ledger.delete_expense(expense_id) is None:
+        return jsonify({'error': 'Expense not found'}), 404
+    return jsonify({'message': 'Expense deleted successfully!', 'id': expense_id}), 200
+
+@app.route('/expenses/<int:expense_id>/history', methods=['GET'])
+def get_expense_history(expense_id):
+    events = ledger.history(expense_id)
+    if not events:
+        return jsonify({'error': 'Expense not found'}), 404
+    return jsonify({'id': expense_id, 'events': events}), 200
+
+@app.route('/recurring', methods=['POST'])
+def create_recurring_rule():
+    try:
+        rule = recurring.create(request.get_json(silent=True))
+    except RecurringError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(rule), 201
+
+@app.route('/recurring/<int:rule_id>', methods=['GET'])
+def get_recurring_rule(rule_id):
+    rule = recurring.get(rule_id)
+    if rule is None:
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify(rule), 200
+
+@app.route('/recurring/<int:rule_id>', methods=['DELETE'])
+def cancel_recurring_rule(rule_id):
+    if not recurring.cancel(rule_id):
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify({'message': 'Recurring expense cancelled', 'id': rule_id}), 200
+
+def _parse_date(value, end_of_day=False):
+    """Parse an ISO date filter; bare end dates cover the whole day"""
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
+
+def _parse_at(value):
+    """Parse a point-in-time query into the UTC format events are stamped with"""
+    parsed = datetime.fromisoformat(_parse_date(value, end_of_day=True))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(timespec='milliseconds')
 
 @app.route('/expenses', methods=['GET'])
 def get_expenses():
-    return jsonify(expenses), 200
+    args = request.args
+    currency = args.get('currency', '').upper() or None
+    # Amount bounds are read in the currency being filtered on
+    amount_currency = currency or ledger.currency
+    try:
+        limit = int(args.get('limit', app.config['EXPENSES_PAGE_SIZE']))
+        filters = {
+            'user': args.get('user'),
+            'group': args.get('group'),
+            'after': int(args['after']) if 'after' in args else None,
+            'start': _parse_date(args['start']) if 'start' in args else None,
+            'end': _parse_date(args['end'], end_of_day=True) if 'end' in args else None,
+            'min_amount': to_minor(args['min_amount'], amount_currency) if 'min_amount' in args else None,
+            'max_amount': to_minor(args['max_amount'], amount_currency) if 'max_amount' in args else None,
+        }
+        # Larger numbers cannot be bound as SQLite integers
+        if any(abs(filters[name]) > MAX_MINOR for name in ('after', 'min_amount', 'max_amount')
+               if filters[name] is not None):
+            raise ValueError('Query parameter out of range')
+        if currency or 'min_amount' in args or 'max_amount' in args:
+            filters['currency'] = amount_currency
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameter'}), 400
+    limit = max(1, min(limit, app.config['EXPENSES_MAX_PAGE_SIZE']))
+
+    # The ledger revision changes on every write, so an unchanged revision
+    # and query means an unchanged page: answer 304 before touching rows.
+    key = f"{ledger.revision}:{limit}:{sorted(filters.items())}"
+    etag = hashlib.sha1(key.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    # Fetch one extra row to learn whether another page follows
+    expenses = ledger.list_expenses(limit=limit + 1, **filters)
+    next_cursor = None
+    if len(expenses) > limit:
+        expenses = expenses[:limit]
+        next_cursor = expenses[-1]['id']
+
+    response = jsonify({
+        'data': expenses,
+        'meta': {'limit': limit, 'next_cursor': next_cursor}
+    })
+    response.set_etag(etag)
+    return response, 200
+
+@app.route('/balances', methods=['GET'])
+def get_balances():
+    try:
+        at = _parse_at(request.args['at']) if 'at' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO 8601 date or time'}), 400
+    balances = ledger.balances.net(group=request.args.get('group'), at=at)
+    return jsonify({
+        'currency': ledger.currency,
+        'at': at,
+        'balances': {user: _money(amount) for user, amount in balances.items()}
+    }), 200
+
+@app.route('/balances/<user>', methods=['GET'])
+def get_user_balance(user):
+    try:
+        at = _parse_at(request.args['at']) if 'at' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO 8601 date or time'}), 400
+    balance = ledger.balances.for_user(user, group=request.args.get('group'), at=at)
+    return jsonify({
+        'user': user,
+        'currency': ledger.currency,
+        'at': at,
+        'net': _money(balance['net']),
+        'owes': {other: _money(amount) for other, amount in balance['owes'].items()},
+        'owed_by': {other: _money(amount) for other, amount in balance['owed_by'].items()}
+    }), 200
+
+@app.route('/settle', methods=['GET'])
+def settle_up():
+    method = request.args.get('method', 'auto')
+    if method not in ('auto', 'greedy', 'exact'):
+        return jsonify({'error': 'method must be one of auto, greedy, exact'}), 400
+    budget_ms = app.config['SETTLE_TIME_BUDGET_MS']
+    if 'budget_ms' in request.args:
+        requested = request.args.get('budget_ms', type=int)
+        if requested is None or requested <= 0:
+            return jsonify({'error': 'budget_ms must be a positive integer'}), 400
+        # Clients may ask for less time than the configured budget, never more
+        budget_ms = min(budget_ms, requested)
+
+    group = request.args.get('group')
+    try:
+        transfers, method = settle(
+            ledger.balances.net(group=group),
+            method=method,
+            budget_ms=budget_ms,
+            exact_max_users=app.config['SETTLE_EXACT_MAX_USERS']
+        )
+    except SettleTimeout:
+        return jsonify({'error': 'Settlement did not finish within the time budget'}), 503
+    for transfer in transfers:
+        transfer['amount'] = _money(transfer['amount'])
+    return jsonify({
+        'group': group,
+        'method': method,
+        'currency': ledger.currency,
+        'transfers': transfers
+    }), 200
+
+@app.cli.command('rebuild-balances')
+@click.option('--check', is_flag=True, help='Only report differences, do not rewrite balances.')
+def rebuild_balances(check):
+    """Recompute the balance tables from the expense ledger"""
+    mismatches = ledger.balances.rebuild(check=check)
+    if not check:
+        click.echo('Balances rebuilt from ledger.')
+        return
+    for group, user, stored, expected in mismatches:
+        click.echo(f"{group or '-'}\t{user}\tstored={_money(stored)}\texpected={_money(expected)}")
+    click.echo(f'{len(mismatches)} mismatched balance(s).')
+    if mismatches:
+        raise SystemExit(1)
+
+@app.cli.command('run-recurring')
+def run_recurring():
+    """Create every recurring expense that is due now"""
+    created = recurring.run_due()
+    click.echo(f'{len(created)} recurring expense(s) created.')
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Development server only; see gunicorn.conf.py for production serving
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1')
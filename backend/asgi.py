@@ -0,0 +1,16 @@
+"""ASGI entry point for the expense backend
+
+Serve with an ASGI server, e.g.::
+
+    uvicorn asgi:asgi_app --workers 4
+
+Requests run the Flask app on a pool of ``ASGI_THREADS`` threads per
+worker process (default 10), so a slow request such as a bulk import ties
+up one thread while the others keep serving. Keep ``LEDGER_POOL_SIZE`` at
+least this large.
+"""
+import os
+from a2wsgi import WSGIMiddleware
+from app import app
+
+asgi_app = WSGIMiddleware(app, workers=int(os.getenv('ASGI_THREADS', '10')))
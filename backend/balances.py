@@ -0,0 +1,271 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from money import allocate_many
+
+# Expenses replayed per vectorized split when rebuilding from the ledger
+CHUNK_SIZE = 10000
+
+
+def balance_deltas(expenses, convert=None):
+    """Aggregate the balance changes caused by an iterable of expenses
+
+    Returns ``(net, pairs)`` where ``net`` maps ``(group, user)`` to the change
+    in that user's net balance (positive means they are owed money) and
+    ``pairs`` maps ``(group, user_a, user_b)`` with ``user_a < user_b`` to the
+    change in what ``user_a`` owes ``user_b``. All amounts are integer minor
+    units, after ``convert(expense)`` has brought each expense total into
+    the balance currency. Shares are computed a chunk at a time with one vectorized split
+    per chunk, so replaying a whole ledger keeps memory bounded.
+    """
+    net = defaultdict(int)
+    pairs = defaultdict(int)
+    expenses = iter(expenses)
+    while True:
+        chunk = list(islice(expenses, CHUNK_SIZE))
+        if not chunk:
+            break
+        totals = [convert(expense) if convert else expense['amount_minor'] for expense in chunk]
+        all_shares = allocate_many(
+            totals,
+            [expense['weights'] for expense in chunk]
+        )
+        for expense, shares in zip(chunk, all_shares):
+            group = expense['group'] or ''
+            payer = expense['paid_by']
+            for user, share in zip(expense['participants'], shares):
+                if user == payer or not share:
+                    continue
+                net[(group, payer)] += share
+                net[(group, user)] -= share
+                if user < payer:
+                    pairs[(group, user, payer)] += share
+                else:
+                    pairs[(group, payer, user)] -= share
+    return net, pairs
+
+
+def change_deltas(added, removed=(), convert=None):
+    """Like :func:`balance_deltas`, less the effect of the ``removed`` expenses"""
+    net, pairs = balance_deltas(added, convert)
+    if removed:
+        removed_net, removed_pairs = balance_deltas(removed, convert)
+        for key, amount in removed_net.items():
+            net[key] -= amount
+        for key, amount in removed_pairs.items():
+            pairs[key] -= amount
+    return net, pairs
+
+
+def _owed_summary(user, rows):
+    """Build a for_user() result from (other, amount user owes other) rows"""
+    owes, owed_by = {}, {}
+    for other, owed in rows:
+        if owed > 0:
+            owes[other] = owed
+        elif owed < 0:
+            owed_by[other] = -owed
+    return {
+        'user': user,
+        'net': sum(owed_by.values()) - sum(owes.values()),
+        'owes': owes,
+        'owed_by': owed_by,
+    }
+
+
+class BalanceTable:
+    """Running per-user and pairwise balances kept alongside the ledger
+
+    Balances are stored in the ledger database and updated in the same
+    transaction as the expenses that change them, so every write costs
+    O(participants) and reads never have to walk the expense history.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def apply(self, conn, expenses, removed=()):
+        """Fold a batch of expenses into the stored balances
+
+        Expenses in ``removed`` are taken back out, which is how edits and
+        deletions reverse the old version of an expense.
+        """
+        net, pairs = change_deltas(expenses, removed, self.ledger.convert)
+        conn.executemany(
+            'INSERT INTO balances (user_id, group_id, amount) VALUES (?, ?, ?) '
+            'ON CONFLICT (user_id, group_id) DO UPDATE SET amount = amount + excluded.amount',
+            [(user, group, amount) for (group, user), amount in net.items()]
+        )
+        conn.executemany(
+            'INSERT INTO pair_balances (user_a, user_b, group_id, amount) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (user_a, user_b, group_id) DO UPDATE SET amount = amount + excluded.amount',
+            [(a, b, group, amount) for (group, a, b), amount in pairs.items()]
+        )
+
+    def net(self, group=None, at=None):
+        """Return {user: net balance in minor units}, across all groups unless one is given
+
+        ``at`` is an ISO UTC timestamp to report balances as they stood then.
+        """
+        if at is not None:
+            net, _ = self.as_of(at, group)
+            totals = defaultdict(int)
+            for (_, user), amount in net.items():
+                totals[user] += amount
+            return {user: amount for user, amount in totals.items() if amount}
+        if group is None:
+            rows = self.ledger.conn.execute(
+                'SELECT user_id, SUM(amount) AS amount FROM balances GROUP BY user_id'
+            )
+        else:
+            rows = self.ledger.conn.execute(
+                'SELECT user_id, amount FROM balances WHERE group_id = ?', (group,)
+            )
+        return {row['user_id']: row['amount'] for row in rows if row['amount']}
+
+    def for_user(self, user, group=None, at=None):
+        """Return a user's net balance and who they owe / are owed by, in minor units"""
+        if at is not None:
+            _, pairs = self.as_of(at, group)
+            owed = defaultdict(int)
+            for (_, a, b), amount in pairs.items():
+                if a == user:
+                    owed[b] += amount
+                elif b == user:
+                    owed[a] -= amount
+            return _owed_summary(user, owed.items())
+
+        params = [user, user]
+        group_clause = ''
+        if group is not None:
+            group_clause = ' AND group_id = ?'
+            params = [user, group, user, group]
+        rows = self.ledger.conn.execute(
+            'SELECT user_b AS other, SUM(amount) AS owed FROM pair_balances '
+            f'WHERE user_a = ?{group_clause} GROUP BY user_b '
+            'UNION ALL '
+            'SELECT user_a AS other, -SUM(amount) AS owed FROM pair_balances '
+            f'WHERE user_b = ?{group_clause} GROUP BY user_a',
+            params
+        )
+        return _owed_summary(user, ((row['other'], row['owed']) for row in rows))
+
+    def snapshot(self, conn, every=None):
+        """Copy the balance tables into a snapshot as of the latest event
+
+        With ``every`` set, only snapshot once that many events have been
+        recorded since the previous snapshot. Returns the snapshot's event
+        seq, or None if none was taken.
+        """
+        seq = conn.execute('SELECT MAX(seq) FROM events').fetchone()[0]
+        if seq is None:
+            return None
+        if every:
+            last = conn.execute('SELECT MAX(seq) FROM snapshots').fetchone()[0] or 0
+            if seq - last < every:
+                return None
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO snapshots (seq, taken_at) VALUES (?, ?)',
+            (seq, datetime.utcnow().isoformat())
+        )
+        if not cursor.rowcount:
+            return None
+        conn.execute(
+            'INSERT INTO snapshot_balances (seq, user_id, group_id, amount) '
+            'SELECT ?, user_id, group_id, amount FROM balances WHERE amount != 0',
+            (seq,)
+        )
+        conn.execute(
+            'INSERT INTO snapshot_pair_balances (seq, user_a, user_b, group_id, amount) '
+            'SELECT ?, user_a, user_b, group_id, amount FROM pair_balances WHERE amount != 0',
+            (seq,)
+        )
+        return seq
+
+    def as_of(self, at, group=None):
+        """Return ``(net, pairs)`` keyed like :func:`balance_deltas` as of a UTC timestamp
+
+        Starts from the newest snapshot taken before ``at`` and replays only
+        the events recorded between it and ``at``, so the cost is bounded by
+        the snapshot interval rather than the length of the history.
+        """
+        conn = self.ledger.conn
+        # occurred_at grows with seq, so the last event by time is the last by seq
+        row = conn.execute(
+            'SELECT seq FROM events WHERE occurred_at <= ? '
+            'ORDER BY occurred_at DESC, seq DESC LIMIT 1', (at,)
+        ).fetchone()
+        net, pairs = defaultdict(int), defaultdict(int)
+        if row is None:
+            return net, pairs
+        end = row['seq']
+        start = conn.execute(
+            'SELECT MAX(seq) FROM snapshots WHERE seq <= ?', (end,)
+        ).fetchone()[0] or 0
+
+        group_clause, params = '', [start]
+        if group is not None:
+            group_clause, params = ' AND group_id = ?', [start, group]
+        if start:
+            for row in conn.execute(
+                f'SELECT user_id, group_id, amount FROM snapshot_balances WHERE seq = ?{group_clause}',
+                params
+            ):
+                net[(row['group_id'], row['user_id'])] = row['amount']
+            for row in conn.execute(
+                'SELECT user_a, user_b, group_id, amount FROM snapshot_pair_balances '
+                f'WHERE seq = ?{group_clause}', params
+            ):
+                pairs[(row['group_id'], row['user_a'], row['user_b'])] = row['amount']
+
+        added, removed = [], []
+        for row in conn.execute(
+            'SELECT data, previous FROM events WHERE seq > ? AND seq <= ? ORDER BY seq', (start, end)
+        ):
+            if row['data']:
+                added.append(json.loads(row['data']))
+            if row['previous']:
+                removed.append(json.loads(row['previous']))
+        # An edit may move an expense between groups, so filter after replaying
+        delta_net, delta_pairs = change_deltas(added, removed, self.ledger.convert)
+        for key, amount in delta_net.items():
+            if group is None or key[0] == group:
+                net[key] += amount
+        for key, amount in delta_pairs.items():
+            if group is None or key[0] == group:
+                pairs[key] += amount
+        return net, pairs
+
+    def rebuild(self, check=False):
+        """Recompute balances from the full ledger
+
+        With ``check=True`` the stored tables are left untouched and the list
+        of ``(group, user, stored, expected)`` mismatches is returned instead.
+        """
+        if check:
+            net, _ = balance_deltas(self.ledger.iter_expenses(), self.ledger.convert)
+            stored = {(row['group_id'], row['user_id']): row['amount']
+                      for row in self.ledger.conn.execute('SELECT * FROM balances')}
+            mismatches = []
+            for key in set(stored) | set(net):
+                if stored.get(key, 0) != net.get(key, 0):
+                    mismatches.append((*key, stored.get(key, 0), net.get(key, 0)))
+            return sorted(mismatches)
+
+        with self.ledger.write() as conn:
+            # Hold the database write lock while reading so no expense can
+            # land between the replay and the table swap.
+            conn.execute('BEGIN IMMEDIATE')
+            net, pairs = balance_deltas(self.ledger.iter_expenses(), self.ledger.convert)
+            conn.execute('DELETE FROM balances')
+            conn.execute('DELETE FROM pair_balances')
+            conn.executemany(
+                'INSERT INTO balances (user_id, group_id, amount) VALUES (?, ?, ?)',
+                [(user, group, amount) for (group, user), amount in net.items()]
+            )
+            conn.executemany(
+                'INSERT INTO pair_balances (user_a, user_b, group_id, amount) VALUES (?, ?, ?, ?)',
+                [(a, b, group, amount) for (group, a, b), amount in pairs.items()]
+            )
+        return []
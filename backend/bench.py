@@ -0,0 +1,307 @@
+"""Load-test and benchmark harness for the expense API
+
+Generates a synthetic workload (users, groups, expenses with a mix of split
+types), drives it through the API and writes a JSON report with throughput,
+p50/p95/p99 latency per endpoint and peak RSS, so runs can be diffed across
+commits::
+
+    python bench.py --users 200 --groups 20 --expenses 5000 --output bench.json
+    python bench.py --transport http --concurrency 8
+    python bench.py --transport http --url http://localhost:8000
+
+``--transport client`` calls the app in-process through the Flask test
+client; ``--transport http`` starts a threaded HTTP server on a free port
+(or targets ``--url``) and sends real requests. Unless ``--url`` is given
+the run uses a fresh temporary ledger, so results only depend on the seed.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+SPLIT_TYPES = ('equal', 'percentage', 'shares', 'exact')
+
+
+class ClientTransport:
+    """Send requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """Send requests over HTTP, one keep-alive connection per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            self._local.conn = None
+            conn.close()
+            raise
+
+
+def start_server(app):
+    """Serve the app on a free local port from a background thread"""
+    from werkzeug.serving import make_server
+    # Per-request access logs would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Collects per-endpoint latencies and error counts"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def call(self, transport, name, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = transport.request(method, path, body)
+        except Exception:
+            status, data = None, b''
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            entry = self.samples.setdefault(name, {'latencies': [], 'errors': 0, 'wall': [start, start]})
+            entry['latencies'].append(elapsed)
+            entry['wall'][0] = min(entry['wall'][0], start)
+            entry['wall'][1] = max(entry['wall'][1], start + elapsed)
+            if status is None or status >= 400:
+                entry['errors'] += 1
+        return status, data
+
+    def report(self):
+        endpoints = {}
+        for name, entry in self.samples.items():
+            latencies = sorted(entry['latencies'])
+            wall = entry['wall'][1] - entry['wall'][0]
+            endpoints[name] = {
+                'requests': len(latencies),
+                'errors': entry['errors'],
+                'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'max_ms': round(latencies[-1] * 1000, 3),
+            }
+        return endpoints
+
+
+def make_expense(rng, members, group_id, start_date):
+    """Build one random expense payload for a group"""
+    participants = rng.sample(members, rng.randint(2, min(len(members), 8)))
+    payer = rng.choice(participants)
+    amount_minor = rng.randint(100, 50000)
+    split = rng.choice(SPLIT_TYPES)
+    expense = {
+        'description': f'expense {rng.randrange(10 ** 6)}',
+        'amount': f'{amount_minor / 100:.2f}',
+        'paid_by': payer,
+        'group': group_id,
+        'date': (start_date + timedelta(minutes=rng.randrange(60 * 24 * 365))).isoformat(),
+        'split': split,
+    }
+    if split == 'equal':
+        expense['participants'] = participants
+    elif split == 'percentage':
+        base, extra = divmod(100, len(participants))
+        expense['splits'] = {user: base + (1 if i < extra else 0) for i, user in enumerate(participants)}
+    elif split == 'shares':
+        expense['splits'] = {user: rng.randint(1, 4) for user in participants}
+    else:
+        # Cut the amount into random exact pieces that add up to it
+        cuts = sorted(rng.sample(range(1, amount_minor), len(participants) - 1))
+        pieces = [b - a for a, b in zip([0] + cuts, cuts + [amount_minor])]
+        expense['splits'] = {user: f'{piece / 100:.2f}' for user, piece in zip(participants, pieces)}
+    return expense
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    server = None
+    if args.url:
+        transport = HTTPTransport(args.url)
+    else:
+        # The app reads its configuration at import time
+        os.environ['LEDGER_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'ledger.db')
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from app import app
+        if args.transport == 'http':
+            server, url = start_server(app)
+            transport = HTTPTransport(url)
+        else:
+            transport = ClientTransport(app)
+
+    recorder = Recorder()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency if args.transport == 'http' or args.url else 1)
+
+    def fan_out(calls):
+        list(pool.map(lambda call: recorder.call(transport, *call), calls))
+
+    started = time.perf_counter()
+    # Makes emails unique across runs against the same --url; it comes from
+    # outside the seeded RNG so the workload itself stays reproducible
+    run_id = uuid.uuid4().hex[:8]
+
+    # Users
+    users = []
+    for i in range(args.users):
+        status, data = recorder.call(transport, 'POST /register', 'POST', '/register',
+                                     {'email': f'bench-{run_id}-{i}@example.com', 'name': f'user{i}'})
+        if status == 201:
+            users.append(json.loads(data)['id'])
+    if len(users) < 2:
+        raise SystemExit('Could not register enough users to run the benchmark')
+
+    # Groups of random members
+    groups = []
+    for i in range(args.groups):
+        members = rng.sample(users, min(len(users), args.group_size))
+        status, data = recorder.call(transport, 'POST /groups', 'POST', '/groups',
+                                     {'name': f'group{i}', 'members': members})
+        if status == 201:
+            groups.append((json.loads(data)['id'], members))
+
+    # Expenses
+    start_date = datetime(2026, 1, 1)
+    expenses = []
+    for _ in range(args.expenses):
+        group_id, members = rng.choice(groups)
+        expenses.append(('POST /add_expense', 'POST', '/add_expense',
+                         make_expense(rng, members, group_id, start_date)))
+    fan_out(expenses)
+
+    # Reads: walk paginated listings, then balances and settle-up
+    def walk(name, query):
+        path = f'/expenses?limit={args.page_size}{query}'
+        while path:
+            status, data = recorder.call(transport, name, 'GET', path)
+            if status != 200:
+                return
+            cursor = json.loads(data)['meta']['next_cursor']
+            path = f'/expenses?limit={args.page_size}{query}&after={cursor}' if cursor else None
+
+    sample_groups = rng.sample(groups, min(len(groups), args.reads))
+    sample_users = rng.sample(users, min(len(users), args.reads))
+    list(pool.map(lambda group: walk('GET /expenses?group', f'&group={group[0]}'), sample_groups))
+    list(pool.map(lambda user: walk('GET /expenses?user', f'&user={user}'), sample_users))
+    fan_out([('GET /balances', 'GET', '/balances')] * args.reads)
+    fan_out([('GET /balances?group', 'GET', f'/balances?group={group_id}')
+             for group_id, _ in sample_groups])
+    fan_out([('GET /balances/<user>', 'GET', f'/balances/{user}') for user in sample_users])
+    fan_out([('GET /settle?group', 'GET', f'/settle?group={group_id}')
+             for group_id, _ in sample_groups])
+
+    total = time.perf_counter() - started
+    pool.shutdown()
+    if server is not None:
+        server.shutdown()
+
+    return {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'transport': 'http' if args.url else args.transport,
+            'url': args.url,
+            'params': {
+                'seed': args.seed,
+                'users': args.users,
+                'groups': args.groups,
+                'group_size': args.group_size,
+                'expenses': args.expenses,
+                'reads': args.reads,
+                'page_size': args.page_size,
+                'concurrency': args.concurrency,
+            },
+        },
+        'total_seconds': round(total, 3),
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        'peak_rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1
+        ),
+        'endpoints': recorder.report(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--transport', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='Benchmark an already running server instead of a local one')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--group-size', type=int, default=12)
+    parser.add_argument('--expenses', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=20, help='Groups/users sampled for read endpoints')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4, help='Client threads for HTTP runs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import csv
+import io
+from importer import CSV_LIST_SEPARATOR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - only needed for Parquet exports
+    pa = pq = None
+
+PARQUET_SUPPORTED = pa is not None
+
+# Columns of an export, in order. participants and shares line up, and in
+# CSV both are joined with the importer's list separator.
+EXPORT_COLUMNS = (
+    'id', 'date', 'description', 'amount', 'amount_minor', 'currency',
+    'paid_by', 'split', 'participants', 'shares',
+)
+
+
+def _pages(ledger, group, batch_size):
+    """Yield a group's expenses a keyset page at a time
+
+    Each page is its own short query, so a long export never holds a read
+    transaction (and the WAL) open for its whole duration.
+    """
+    after = None
+    while True:
+        expenses = ledger.list_expenses(group=group, after=after, limit=batch_size)
+        if not expenses:
+            return
+        yield expenses
+        after = expenses[-1]['id']
+
+
+def _record(expense):
+    shares = expense['shares']
+    return (
+        expense['id'], expense['date'], expense['description'], expense['amount'],
+        expense['amount_minor'], expense['currency'], expense['paid_by'], expense['split'],
+        expense['participants'], [shares[user] for user in expense['participants']],
+    )
+
+
+def csv_chunks(ledger, group, batch_size=1000):
+    """Yield a group's expenses as CSV text, one chunk per page of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for expenses in _pages(ledger, group, batch_size):
+        for expense in expenses:
+            record = _record(expense)
+            writer.writerow(record[:-2] + tuple(CSV_LIST_SEPARATOR.join(values) for values in record[-2:]))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_parquet(ledger, group, sink, batch_size=10000):
+    """Write a group's expenses to a Parquet file, one row group per page"""
+    if pa is None:
+        raise RuntimeError('pyarrow is required for Parquet exports')
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.string()),
+        ('description', pa.string()),
+        ('amount', pa.string()),
+        ('amount_minor', pa.int64()),
+        ('currency', pa.string()),
+        ('paid_by', pa.string()),
+        ('split', pa.string()),
+        ('participants', pa.list_(pa.string())),
+        ('shares', pa.list_(pa.string())),
+    ])
+    with pq.ParquetWriter(sink, schema) as writer:
+        for expenses in _pages(ledger, group, batch_size):
+            columns = list(zip(*(_record(expense) for expense in expenses)))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
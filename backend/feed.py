@@ -0,0 +1,94 @@
+import json
+import threading
+from collections import deque
+
+
+def _entry(row, expense):
+    """Compact feed item for one event"""
+    return {
+        'seq': row['seq'],
+        'kind': row['kind'],
+        'occurred_at': row['occurred_at'],
+        'expense_id': row['expense_id'],
+        'description': expense.get('description', ''),
+        'amount': expense['amount'],
+        'currency': expense['currency'],
+        'paid_by': expense['paid_by'],
+        'group': expense['group'],
+    }
+
+
+class ActivityFeed:
+    """Recent expense activity per group, kept in bounded ring buffers
+
+    Each group holds at most ``size`` items, newest last, so memory is
+    capped per group and a page is read straight off the end of a buffer.
+    New events are fanned out into the buffers after every write to the
+    ledger, and before every read to pick up events written by other
+    worker processes; each event is read from the log once. On first use
+    only the last ``backfill`` events are loaded.
+    """
+
+    def __init__(self, ledger, size=200, backfill=10000):
+        self.ledger = ledger
+        self.size = size
+        self.backfill = backfill
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._last_seq = None
+
+    def catch_up(self):
+        """Fan any events recorded since the last call out into group buffers"""
+        with self._lock:
+            conn = self.ledger.conn
+            latest = conn.execute('SELECT MAX(seq) FROM events').fetchone()[0] or 0
+            if self._last_seq is None or latest - self._last_seq > self.backfill:
+                # Anything older would only be pushed out of the buffers again
+                self._last_seq = max(self._last_seq or 0, latest - self.backfill)
+            if latest <= self._last_seq:
+                return
+            for row in conn.execute(
+                'SELECT seq, expense_id, kind, occurred_at, data, previous FROM events '
+                'WHERE seq > ? AND seq <= ? ORDER BY seq', (self._last_seq, latest)
+            ):
+                expense = json.loads(row['data'] or row['previous'])
+                groups = {expense['group']}
+                if row['data'] and row['previous']:
+                    # An edit that moves an expense shows up in both groups
+                    groups.add(json.loads(row['previous'])['group'])
+                entry = _entry(row, expense)
+                for group in groups - {None}:
+                    buffer = self._buffers.get(group)
+                    if buffer is None:
+                        buffer = self._buffers[group] = deque(maxlen=self.size)
+                    buffer.append(entry)
+            self._last_seq = latest
+
+    def page(self, groups, limit=50, before=None, after=None):
+        """Return ``(items, next_cursor)``, newest first, across some groups
+
+        ``before`` pages back through older items and ``after`` polls for
+        items newer than one already seen; both are item ``seq`` values.
+        """
+        self.catch_up()
+        items = []
+        with self._lock:
+            for group in groups:
+                taken = 0
+                for entry in reversed(self._buffers.get(group, ())):
+                    if after is not None and entry['seq'] <= after:
+                        break
+                    if before is not None and entry['seq'] >= before:
+                        continue
+                    items.append(entry)
+                    taken += 1
+                    if taken > limit:
+                        break
+        # An item can sit in two of the groups after a cross-group edit
+        items = sorted({entry['seq']: entry for entry in items}.values(),
+                       key=lambda entry: entry['seq'], reverse=True)
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = items[-1]['seq']
+        return items, next_cursor
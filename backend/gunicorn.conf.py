@@ -0,0 +1,30 @@
+"""Gunicorn settings for serving the expense backend in production
+
+Run with ``gunicorn -c gunicorn.conf.py``. Set ``SERVER_MODE=asgi`` to
+serve ``asgi:asgi_app`` on uvicorn workers instead of threaded WSGI workers.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+# Two processes per core, plus one, so read traffic scales across cores and
+# a core is not left idle while a process waits on I/O; each process opens
+# its own ledger connection pool after forking.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+preload_app = False
+
+if os.getenv('SERVER_MODE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'asgi:asgi_app'
+else:
+    # Threads let a worker keep serving reads while one thread is busy with
+    # a long write; keep LEDGER_POOL_SIZE at least this large.
+    worker_class = 'gthread'
+    wsgi_app = 'app:app'
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# Longest Idempotency-Key header accepted
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeys:
+    """Responses to recent requests, keyed by their Idempotency-Key header
+
+    Keys are recorded in the ledger database in the same transaction as
+    the write they guard, so a retry never repeats that write even when it
+    reaches another worker process. Each worker also keeps the most recent
+    ``max_entries`` responses in an in-memory LRU, so a retry is normally
+    answered with one dict lookup. Entries expire after ``ttl_seconds``.
+    """
+
+    def __init__(self, ledger, ttl_seconds=86400, max_entries=10000):
+        self.ledger = ledger
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    @contextmanager
+    def claim(self, key):
+        """Hold off other requests with the same key in this worker until done"""
+        with self._lock:
+            lock, holders = self._inflight.get(key, (None, 0))
+            if lock is None:
+                lock = threading.Lock()
+            self._inflight[key] = (lock, holders + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, holders = self._inflight[key]
+                if holders == 1:
+                    del self._inflight[key]
+                else:
+                    self._inflight[key] = (lock, holders - 1)
+
+    def get(self, key):
+        """Return the stored ``{fingerprint, status, body}`` for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['expires'] > time.time():
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+        entry = self.lookup(self.ledger.conn, key)
+        if entry is not None:
+            self.remember(key, entry)
+        return entry
+
+    def lookup(self, conn, key):
+        """Read a key from the database, ignoring expired entries"""
+        row = conn.execute(
+            'SELECT fingerprint, status, body, created_at FROM idempotency_keys '
+            'WHERE key = ? AND created_at >= ?', (key, self._cutoff())
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'fingerprint': row['fingerprint'],
+            'status': row['status'],
+            'body': row['body'],
+            'expires': (datetime.fromisoformat(row['created_at']).replace(tzinfo=timezone.utc).timestamp()
+                        + self.ttl_seconds),
+        }
+
+    def store(self, conn, key, fingerprint, status, body):
+        """Record a response inside the write transaction that produced it
+
+        Expired keys are pruned at the same time.
+        """
+        created_at = datetime.utcnow()
+        conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (self._cutoff(),))
+        conn.execute(
+            'INSERT INTO idempotency_keys (key, fingerprint, status, body, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, fingerprint, status, body, created_at.isoformat())
+        )
+        return {
+            'fingerprint': fingerprint,
+            'status': status,
+            'body': body,
+            'expires': time.time() + self.ttl_seconds,
+        }
+
+    def remember(self, key, entry):
+        """Cache an entry in memory, evicting the least recently used"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cutoff(self):
+        return (datetime.utcnow() - timedelta(seconds=self.ttl_seconds)).isoformat()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from ledger import ExpenseError
+
+# Separator for the participants column in CSV uploads
+CSV_LIST_SEPARATOR = ';'
+
+
+def _ndjson_rows(text):
+    """Yield (row_number, payload_or_error) for each non-blank NDJSON line"""
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, ExpenseError(f'Invalid JSON: {e.msg}')
+
+
+def _csv_rows(text):
+    """Yield (row_number, payload) for each CSV record after the header"""
+    reader = csv.DictReader(text)
+    for number, record in enumerate(reader, start=2):
+        row = {key: value for key, value in record.items() if key and value not in (None, '')}
+        if 'participants' in row:
+            row['participants'] = [
+                user.strip() for user in row['participants'].split(CSV_LIST_SEPARATOR) if user.strip()
+            ]
+        yield number, row
+
+
+def parse_rows(stream, fmt):
+    """Lazily parse a binary stream of NDJSON or CSV expense rows"""
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8', newline='')
+    if fmt == 'csv':
+        return _csv_rows(text)
+    return _ndjson_rows(text)
+
+
+def import_expenses(ledger, rows, batch_size=1000, max_errors=1000, validate=None):
+    """Validate rows and insert them into the ledger in batched transactions
+
+    ``validate`` turns a raw row into a normalized expense or raises
+    ExpenseError; it defaults to the ledger's own normalization.
+
+    Invalid rows are skipped and reported; valid rows are committed
+    ``batch_size`` at a time so memory stays flat regardless of upload size.
+    Returns a report dict with the number imported and the per-row errors
+    (at most ``max_errors`` are listed, ``error_count`` has the total).
+    """
+    validate = validate or ledger.normalize
+    report = {'imported': 0, 'error_count': 0, 'errors': []}
+
+    def fail(number, error):
+        report['error_count'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'row': number, 'error': str(error)})
+
+    batch = []
+    for number, row in rows:
+        if isinstance(row, Exception):
+            fail(number, row)
+            continue
+        try:
+            batch.append(validate(row))
+        except ExpenseError as e:
+            fail(number, e)
+            continue
+        if len(batch) >= batch_size:
+            report['imported'] += len(ledger.add_expenses(batch))
+            batch = []
+    if batch:
+        report['imported'] += len(ledger.add_expenses(batch))
+    return report
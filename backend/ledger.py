@@ -0,0 +1,670 @@
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from balances import BalanceTable
+from money import (DEFAULT_CURRENCY, MAX_MINOR, MoneyError, allocate, exponent,
+                   from_minor, split_weights, to_minor)
+from rates import RateError, RateTable
+
+
+def _migrate_minor_units(conn):
+    """Store amounts as integer minor units with explicit split weights"""
+    conn.execute("""
+        CREATE TABLE expenses_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT,
+            amount_minor INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            paid_by TEXT NOT NULL,
+            group_id TEXT,
+            date TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    digits = exponent(DEFAULT_CURRENCY)
+    cursor = conn.execute('SELECT * FROM expenses ORDER BY id')
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        converted = []
+        for row in rows:
+            # Earlier versions stored float amounts split equally
+            expense = json.loads(row['data'])
+            amount_minor = to_minor(f"{row['amount']:.{digits}f}", DEFAULT_CURRENCY)
+            weights = [1] * len(expense['participants'])
+            shares = allocate(amount_minor, weights)
+            expense.update({
+                'amount': from_minor(amount_minor, DEFAULT_CURRENCY),
+                'amount_minor': amount_minor,
+                'currency': DEFAULT_CURRENCY,
+                'split': 'equal',
+                'weights': weights,
+                'shares': {user: from_minor(share, DEFAULT_CURRENCY)
+                           for user, share in zip(expense['participants'], shares)},
+            })
+            converted.append((row['id'], row['description'], amount_minor, DEFAULT_CURRENCY,
+                              row['paid_by'], row['group_id'], row['date'], json.dumps(expense)))
+        conn.executemany('INSERT INTO expenses_new VALUES (?, ?, ?, ?, ?, ?, ?, ?)', converted)
+
+    conn.execute('DROP TABLE expenses')
+    conn.execute('ALTER TABLE expenses_new RENAME TO expenses')
+    conn.execute('CREATE INDEX ix_expenses_group ON expenses (group_id, id)')
+    conn.execute('CREATE INDEX ix_expenses_date ON expenses (date)')
+
+    # Balances become integer minor units; they are rebuilt after migrating
+    for table in ('balances', 'pair_balances'):
+        conn.execute(f'DROP TABLE {table}')
+    conn.execute("""
+        CREATE TABLE balances (
+            user_id TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            PRIMARY KEY (user_id, group_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute('CREATE INDEX ix_balances_group ON balances (group_id)')
+    conn.execute("""
+        CREATE TABLE pair_balances (
+            user_a TEXT NOT NULL,
+            user_b TEXT NOT NULL,
+            group_id TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            PRIMARY KEY (user_a, user_b, group_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute('CREATE INDEX ix_pair_balances_user_b ON pair_balances (user_b, user_a)')
+
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records
+# how many have been applied to a given database file. Entries are SQL
+# scripts, or callables taking the connection for steps that need to rewrite
+# rows in Python.
+MIGRATIONS = [
+    """
+    CREATE TABLE expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        description TEXT,
+        amount REAL NOT NULL,
+        paid_by TEXT NOT NULL,
+        group_id TEXT,
+        date TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX ix_expenses_group ON expenses (group_id, id);
+
+    -- One row per user involved in an expense (payer and participants), so
+    -- per-user listings are an index range scan instead of a table scan.
+    CREATE TABLE expense_users (
+        user_id TEXT NOT NULL,
+        expense_id INTEGER NOT NULL REFERENCES expenses (id),
+        PRIMARY KEY (user_id, expense_id)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE balances (
+        user_id TEXT NOT NULL,
+        group_id TEXT NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (user_id, group_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX ix_balances_group ON balances (group_id);
+
+    -- Pairwise balances keep one row per unordered pair (user_a < user_b);
+    -- a positive amount means user_a owes user_b.
+    CREATE TABLE pair_balances (
+        user_a TEXT NOT NULL,
+        user_b TEXT NOT NULL,
+        group_id TEXT NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (user_a, user_b, group_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX ix_pair_balances_user_b ON pair_balances (user_b, user_a);
+    """,
+    """
+    CREATE INDEX ix_expenses_date ON expenses (date);
+
+    -- Bumped on every write so readers can tell whether anything changed
+    -- without looking at the data itself.
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT INTO meta (key, value) VALUES ('revision', 0);
+    """,
+    _migrate_minor_units,
+    """
+    CREATE TABLE users (
+        id TEXT PRIMARY KEY,
+        email TEXT NOT NULL,
+        name TEXT,
+        data TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX ix_users_email ON users (email);
+
+    CREATE TABLE user_groups (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    );
+
+    CREATE TABLE group_members (
+        group_id TEXT NOT NULL REFERENCES user_groups (id),
+        user_id TEXT NOT NULL REFERENCES users (id),
+        PRIMARY KEY (group_id, user_id)
+    ) WITHOUT ROWID;
+    """,
+    """
+    -- Append-only history of every change to an expense: data is the expense
+    -- after the change and previous the expense before it, so any run of
+    -- events can be replayed without looking anything else up. occurred_at
+    -- defaults to the time the row is written, i.e. while the writer holds
+    -- the database lock, so it increases with seq across worker processes.
+    CREATE TABLE events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        expense_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        occurred_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+        data TEXT,
+        previous TEXT
+    );
+    CREATE INDEX ix_events_expense ON events (expense_id, seq);
+    CREATE INDEX ix_events_occurred_at ON events (occurred_at);
+
+    -- Expenses recorded before the log existed count from their own date
+    INSERT INTO events (expense_id, kind, occurred_at, data)
+    SELECT id, 'create', MIN(date, strftime('%Y-%m-%dT%H:%M:%f', 'now')), data
+    FROM expenses ORDER BY 3, id;
+
+    -- Copies of the balance tables as of event seq
+    CREATE TABLE snapshots (
+        seq INTEGER PRIMARY KEY,
+        taken_at TEXT NOT NULL
+    );
+    CREATE TABLE snapshot_balances (
+        seq INTEGER NOT NULL REFERENCES snapshots (seq),
+        user_id TEXT NOT NULL,
+        group_id TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (seq, group_id, user_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE snapshot_pair_balances (
+        seq INTEGER NOT NULL REFERENCES snapshots (seq),
+        user_a TEXT NOT NULL,
+        user_b TEXT NOT NULL,
+        group_id TEXT NOT NULL,
+        amount INTEGER NOT NULL,
+        PRIMARY KEY (seq, group_id, user_a, user_b)
+    ) WITHOUT ROWID;
+    """,
+    """
+    -- template is the expense payload each occurrence is created from.
+    -- Occurrence n falls on starts_at advanced by n * every periods, and
+    -- next_due is NULL once a rule has ended or been cancelled.
+    CREATE TABLE recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template TEXT NOT NULL,
+        frequency TEXT NOT NULL,
+        every INTEGER NOT NULL,
+        starts_at TEXT NOT NULL,
+        ends_at TEXT,
+        occurrences INTEGER NOT NULL DEFAULT 0,
+        next_due TEXT,
+        created_at TEXT NOT NULL
+    );
+    CREATE INDEX ix_recurring_rules_due ON recurring_rules (next_due) WHERE next_due IS NOT NULL;
+    """,
+    """
+    CREATE INDEX ix_group_members_user ON group_members (user_id);
+    """,
+    """
+    -- Responses to requests sent with an Idempotency-Key header
+    CREATE TABLE idempotency_keys (
+        key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        body TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX ix_idempotency_keys_created_at ON idempotency_keys (created_at);
+    """,
+]
+
+# Schema version that last changed how balances are stored; older ledgers are
+# backfilled from their expense history when they are upgraded.
+BALANCES_VERSION = 4
+
+# Schema version that introduced the event log; ledgers upgraded past it get
+# an initial snapshot so point-in-time queries need not replay the backfill.
+EVENTS_VERSION = 6
+
+
+class ExpenseError(ValueError):
+    """Raised when an expense payload cannot be recorded"""
+
+
+def normalize_expense(data, currency=DEFAULT_CURRENCY, rates=None):
+    """Validate an expense payload and return the dict the ledger stores
+
+    Amounts are converted to integer minor units of the expense currency
+    (``currency`` unless the payload names another) and every split method
+    is reduced to integer weights, so shares can be recomputed exactly and
+    always add up to the expense amount. Expenses in a currency other than
+    ``currency`` need a rate for their date in ``rates``.
+    """
+    if not isinstance(data, dict):
+        raise ExpenseError('Expense must be a JSON object')
+
+    default_currency = currency
+    currency = str(data.get('currency') or default_currency).upper()
+    if len(currency) != 3 or not currency.isalpha():
+        raise ExpenseError('currency must be a three-letter ISO 4217 code')
+
+    paid_by = data.get('paid_by')
+    if paid_by in (None, ''):
+        raise ExpenseError('paid_by is required')
+    paid_by = str(paid_by)
+
+    if data.get('amount') in (None, ''):
+        raise ExpenseError('amount is required')
+    try:
+        amount_minor = to_minor(data['amount'], currency)
+    except MoneyError as e:
+        raise ExpenseError(f'Invalid amount: {e}') from e
+    if amount_minor <= 0:
+        raise ExpenseError('amount must be positive')
+    if amount_minor > MAX_MINOR:
+        raise ExpenseError('amount is too large')
+
+    split = data.get('split', 'equal')
+    if split == 'equal':
+        participants = data.get('participants') or [paid_by]
+        if not isinstance(participants, list):
+            raise ExpenseError('participants must be a list')
+        # Keep the client's order but drop duplicates
+        participants = list(dict.fromkeys(str(p) for p in participants))
+        values = participants
+    else:
+        splits = data.get('splits')
+        if not isinstance(splits, dict) or not splits:
+            raise ExpenseError(f'splits must map each participant to a value for a {split} split')
+        participants = [str(user) for user in splits]
+        values = list(splits.values())
+    try:
+        weights = split_weights(split, amount_minor, values, currency)
+        shares = allocate(amount_minor, weights)
+    except MoneyError as e:
+        raise ExpenseError(str(e)) from e
+
+    date = data.get('date')
+    if date:
+        try:
+            date = datetime.fromisoformat(str(date)).isoformat()
+        except ValueError:
+            raise ExpenseError('date must be an ISO 8601 date')
+    else:
+        date = datetime.utcnow().isoformat()
+
+    if currency != default_currency:
+        if rates is None:
+            raise ExpenseError(f'Only {default_currency} expenses are supported')
+        try:
+            rates.rate(currency, date[:10])
+        except RateError as e:
+            raise ExpenseError(str(e)) from e
+
+    group = data.get('group')
+    expense = dict(data)
+    expense.update({
+        'description': data.get('description', ''),
+        'amount': from_minor(amount_minor, currency),
+        'amount_minor': amount_minor,
+        'currency': currency,
+        'paid_by': paid_by,
+        'participants': participants,
+        'split': split,
+        'weights': weights,
+        'shares': {user: from_minor(share, currency) for user, share in zip(participants, shares)},
+        'group': str(group) if group not in (None, '') else None,
+        'date': date,
+    })
+    expense.pop('id', None)
+    return expense
+
+
+def _statements(script):
+    """Split a migration script into individual SQL statements"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared by a worker's threads
+
+    At most ``size`` connections are checked out at once; further callers
+    wait up to their timeout for one to be returned. Idle connections are
+    reused most-recently-returned first so the warmest page cache is used.
+    """
+
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._slots.release()
+
+
+class Ledger:
+    """SQLite-backed expense store with per-user and per-group indexes
+
+    Request handlers check a connection out of the pool with
+    :meth:`checkout` and return it with :meth:`checkin`; code running
+    outside a request (CLI commands, background jobs) transparently gets a
+    private connection for its thread.
+    """
+
+    def __init__(self, path, currency=DEFAULT_CURRENCY, rates=None, pool_size=8,
+                 snapshot_interval=1000):
+        self.path = path
+        self.currency = currency
+        self.rates = rates or RateTable(currency)
+        self.pool = ConnectionPool(self._connect, pool_size)
+        self.snapshot_interval = snapshot_interval
+        # Callables run after every committed write, e.g. to fan out events
+        self.listeners = []
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.balances = BalanceTable(self)
+        previous = self._migrate()
+        if 0 < previous < BALANCES_VERSION:
+            self.balances.rebuild()
+        if 0 < previous < EVENTS_VERSION:
+            with self.write() as conn:
+                self.balances.snapshot(conn)
+
+    def _connect(self):
+        # Pooled connections move between threads; the write lock and the
+        # pool guarantee only one thread uses a connection at a time.
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    @property
+    def conn(self):
+        """Connection for the calling thread: its checked-out one, else a private one"""
+        conn = getattr(self._local, 'pooled', None) or getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def checkout(self, timeout=None):
+        """Bind a pooled connection to the calling thread"""
+        self._local.pooled = self.pool.acquire(timeout)
+
+    def checkin(self):
+        """Return the calling thread's pooled connection, if it has one"""
+        conn = getattr(self._local, 'pooled', None)
+        if conn is not None:
+            self._local.pooled = None
+            self.pool.release(conn)
+
+    def _migrate(self):
+        """Apply any schema migrations the database has not seen yet
+
+        All pending steps run in one ``BEGIN IMMEDIATE`` transaction, which
+        holds the database write lock, so workers starting at the same time
+        apply each migration exactly once. Returns the schema version the
+        database was at before upgrading.
+        """
+        with self._write_lock:
+            conn = self.conn
+            # Table rebuilds drop and recreate referenced tables
+            conn.execute('PRAGMA foreign_keys=OFF')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                for index, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                    if callable(step):
+                        step(conn)
+                    else:
+                        for statement in _statements(step):
+                            conn.execute(statement)
+                    conn.execute(f'PRAGMA user_version = {index}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute('PRAGMA foreign_keys=ON')
+        return version
+
+    @contextmanager
+    def write(self):
+        """Serialize a write transaction on this thread's connection"""
+        with self._write_lock, self.conn as conn:
+            yield conn
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        for listener in self.listeners:
+            listener()
+
+    @property
+    def revision(self):
+        """Counter that changes whenever the ledger is written to"""
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def normalize(self, data):
+        """Validate an expense payload against this ledger's currency and rates"""
+        return normalize_expense(data, self.currency, self.rates)
+
+    def convert(self, expense):
+        """An expense's amount in minor units of the ledger currency"""
+        return self.rates.convert(expense['amount_minor'], expense['currency'], expense['date'][:10])
+
+    def add_expense(self, data):
+        """Validate and persist one expense, returning it with its id"""
+        return self.add_expenses([self.normalize(data)])[0]
+
+    def add_expenses(self, expenses):
+        """Persist already-normalized expenses in a single transaction
+
+        Balances are updated once for the whole batch, so bulk loads pay for
+        one set of balance upserts per batch instead of one per expense.
+        """
+        with self.write() as conn:
+            return self.record_expenses(conn, expenses)
+
+    def record_expenses(self, conn, expenses):
+        """Insert normalized expenses inside a caller's :meth:`write` transaction"""
+        links, events = [], []
+        for expense in expenses:
+            data = json.dumps(expense)
+            cursor = conn.execute(
+                'INSERT INTO expenses '
+                '(description, amount_minor, currency, paid_by, group_id, date, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (expense['description'], expense['amount_minor'], expense['currency'],
+                 expense['paid_by'], expense['group'], expense['date'], data)
+            )
+            expense['id'] = cursor.lastrowid
+            users = {expense['paid_by'], *expense['participants']}
+            links.extend((user, expense['id']) for user in users)
+            events.append((expense['id'], 'create', data, None))
+        conn.executemany(
+            'INSERT INTO expense_users (user_id, expense_id) VALUES (?, ?)', links
+        )
+        self.balances.apply(conn, expenses)
+        self._record(conn, events)
+        return expenses
+
+    def update_expense(self, expense_id, expense):
+        """Replace an expense with an already-normalized one
+
+        Returns the new expense, or None if there is no such expense. The
+        old version's effect on balances is reversed in the same transaction.
+        """
+        with self.write() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, data FROM expenses WHERE id = ?', (expense_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            data = json.dumps(expense)
+            conn.execute(
+                'UPDATE expenses SET description = ?, amount_minor = ?, currency = ?, '
+                'paid_by = ?, group_id = ?, date = ?, data = ? WHERE id = ?',
+                (expense['description'], expense['amount_minor'], expense['currency'],
+                 expense['paid_by'], expense['group'], expense['date'], data, expense_id)
+            )
+            conn.execute('DELETE FROM expense_users WHERE expense_id = ?', (expense_id,))
+            conn.executemany(
+                'INSERT INTO expense_users (user_id, expense_id) VALUES (?, ?)',
+                [(user, expense_id) for user in {expense['paid_by'], *expense['participants']}]
+            )
+            self.balances.apply(conn, [expense], removed=[self._row_to_expense(row)])
+            self._record(conn, [(expense_id, 'edit', data, row['data'])])
+        expense['id'] = expense_id
+        return expense
+
+    def delete_expense(self, expense_id):
+        """Remove an expense, returning it, or None if there is no such expense"""
+        with self.write() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, data FROM expenses WHERE id = ?', (expense_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            expense = self._row_to_expense(row)
+            conn.execute('DELETE FROM expense_users WHERE expense_id = ?', (expense_id,))
+            conn.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
+            self.balances.apply(conn, [], removed=[expense])
+            self._record(conn, [(expense_id, 'delete', None, row['data'])])
+        return expense
+
+    def _record(self, conn, events):
+        """Append (expense_id, kind, data, previous) rows to the event log
+
+        Every ``snapshot_interval`` events the balance tables are copied
+        into a snapshot, which bounds how many events a point-in-time
+        query has to replay.
+        """
+        conn.executemany(
+            'INSERT INTO events (expense_id, kind, data, previous) VALUES (?, ?, ?, ?)', events
+        )
+        if self.snapshot_interval:
+            self.balances.snapshot(conn, every=self.snapshot_interval)
+
+    def history(self, expense_id):
+        """Return the events recorded for one expense, oldest first"""
+        rows = self.conn.execute(
+            'SELECT seq, kind, occurred_at, data FROM events WHERE expense_id = ? ORDER BY seq',
+            (expense_id,)
+        )
+        return [{
+            'seq': row['seq'],
+            'kind': row['kind'],
+            'occurred_at': row['occurred_at'],
+            'expense': json.loads(row['data']) if row['data'] else None,
+        } for row in rows]
+
+    def get_expense(self, expense_id):
+        """Return a single expense or None"""
+        row = self.conn.execute(
+            'SELECT id, data FROM expenses WHERE id = ?', (expense_id,)
+        ).fetchone()
+        return self._row_to_expense(row) if row else None
+
+    def list_expenses(self, user=None, group=None, after=None, limit=None,
+                      start=None, end=None, min_amount=None, max_amount=None,
+                      currency=None):
+        """Return expenses in id order, filtered and paginated
+
+        ``after`` is a keyset cursor: only expenses with a larger id are
+        returned, so each page costs the same no matter how deep it is.
+        ``start``/``end`` bound the expense date (inclusive) and
+        ``min_amount``/``max_amount`` the amount in minor units of the
+        expense currency; combine them with ``currency`` so the comparison is
+        between like amounts.
+        """
+        sql = 'SELECT e.id, e.data FROM expenses e'
+        clauses, params = [], []
+        if user is not None:
+            sql += ' JOIN expense_users u ON u.expense_id = e.id'
+            clauses.append('u.user_id = ?')
+            params.append(str(user))
+        if group is not None:
+            clauses.append('e.group_id = ?')
+            params.append(str(group))
+        if after is not None:
+            clauses.append('e.id > ?')
+            params.append(after)
+        if start is not None:
+            clauses.append('e.date >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('e.date <= ?')
+            params.append(end)
+        if currency is not None:
+            clauses.append('e.currency = ?')
+            params.append(currency)
+        if min_amount is not None:
+            clauses.append('e.amount_minor >= ?')
+            params.append(min_amount)
+        if max_amount is not None:
+            clauses.append('e.amount_minor <= ?')
+            params.append(max_amount)
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY e.id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [self._row_to_expense(row) for row in self.conn.execute(sql, params)]
+
+    def iter_expenses(self, batch_size=1000):
+        """Yield every expense in id order without loading the whole ledger"""
+        cursor = self.conn.execute('SELECT id, data FROM expenses ORDER BY id')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_expense(row)
+
+    @staticmethod
+    def _row_to_expense(row):
+        expense = json.loads(row['data'])
+        expense['id'] = row['id']
+        return expense
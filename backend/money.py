@@ -0,0 +1,180 @@
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+from math import gcd, lcm
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy only speeds up batch splits
+    np = None
+
+DEFAULT_CURRENCY = 'USD'
+
+# ISO 4217 currencies whose minor unit is not the usual 1/100
+MINOR_UNITS = {
+    'BHD': 3, 'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'IQD': 3, 'ISK': 0,
+    'JOD': 3, 'JPY': 0, 'KMF': 0, 'KRW': 0, 'KWD': 3, 'LYD': 3, 'OMR': 3,
+    'PYG': 0, 'RWF': 0, 'TND': 3, 'UGX': 0, 'UYI': 0, 'VND': 0, 'VUV': 0,
+    'XAF': 0, 'XOF': 0, 'XPF': 0,
+}
+
+SPLIT_METHODS = ('equal', 'percentage', 'shares', 'exact')
+
+# Largest value an SQLite INTEGER column holds, and so the largest amount in
+# minor units the ledger can store or filter on
+MAX_MINOR = 2 ** 63 - 1
+
+# Below this many expenses the pure-Python path beats NumPy's setup cost
+VECTORIZE_MIN_BATCH = 64
+
+
+class MoneyError(ValueError):
+    """Raised for amounts or splits that cannot be represented exactly"""
+
+
+def exponent(currency):
+    """Number of decimal places in a currency's minor unit"""
+    return MINOR_UNITS.get(currency, 2)
+
+
+def _decimal(value):
+    # Go through str() so a float like 19.99 is read as written, not as the
+    # nearest binary fraction.
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise MoneyError(f'{value!r} is not a number')
+    if not number.is_finite():
+        raise MoneyError(f'{value!r} is not a number')
+    return number
+
+
+def to_minor(value, currency):
+    """Convert a major-unit amount (e.g. '12.34') to integer minor units"""
+    scaled = _decimal(value).scaleb(exponent(currency))
+    if scaled != scaled.to_integral_value():
+        raise MoneyError(f'{value} has more decimal places than {currency} allows')
+    return int(scaled)
+
+
+def from_minor(minor, currency):
+    """Format integer minor units as a major-unit decimal string"""
+    return str(Decimal(minor).scaleb(-exponent(currency)))
+
+
+def allocate(total, weights):
+    """Split an integer total proportionally to integer weights
+
+    Every part is rounded down and the leftover units go to the parts with
+    the largest remainders, earlier parts winning ties, so the result always
+    sums to ``total`` and is the same on every run.
+    """
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise MoneyError('Split weights must add up to more than zero')
+    parts = []
+    remainders = []
+    for index, weight in enumerate(weights):
+        part, remainder = divmod(total * weight, weight_sum)
+        parts.append(part)
+        remainders.append((-remainder, index))
+    for _, index in sorted(remainders)[:total - sum(parts)]:
+        parts[index] += 1
+    return parts
+
+
+def allocate_batch(totals, owners, weights):
+    """Vectorized :func:`allocate` over many expenses at once
+
+    ``totals`` holds one integer total per expense, and ``owners[i]`` is the
+    index into ``totals`` that ``weights[i]`` belongs to. Returns an int64
+    array of parts aligned with ``weights``, identical to calling
+    :func:`allocate` per expense. Raises OverflowError if the products
+    would not fit in 64 bits.
+    """
+    if np is None:
+        raise RuntimeError('NumPy is required for batch allocation')
+    totals = np.asarray(totals, dtype=np.int64)
+    owners = np.asarray(owners, dtype=np.intp)
+    weights = np.asarray(weights, dtype=np.int64)
+    if len(weights) and int(totals.max()) * int(weights.max()) >= 2 ** 63:
+        raise OverflowError('Split too large for int64 batch allocation')
+
+    weight_sums = np.zeros(len(totals), dtype=np.int64)
+    np.add.at(weight_sums, owners, weights)
+    scaled = totals[owners] * weights
+    parts, remainders = np.divmod(scaled, weight_sums[owners])
+
+    allocated = np.zeros(len(totals), dtype=np.int64)
+    np.add.at(allocated, owners, parts)
+    leftover = totals - allocated
+
+    # Rank each part within its expense by remainder (largest first), then by
+    # position, and hand one extra unit to the first `leftover` of them.
+    order = np.lexsort((np.arange(len(weights)), -remainders, owners))
+    grouped = owners[order]
+    rank = np.arange(len(order)) - np.searchsorted(grouped, grouped, side='left')
+    parts[order] += rank < leftover[grouped]
+    return parts
+
+
+def allocate_many(totals, weight_lists):
+    """Split many totals at once, returning one list of parts per total
+
+    Large batches go through :func:`allocate_batch` as a single vectorized
+    pass; small ones, or any batch when NumPy is unavailable, fall back to
+    :func:`allocate`. Both paths give identical results.
+    """
+    if np is None or len(totals) < VECTORIZE_MIN_BATCH:
+        return [allocate(total, weights) for total, weights in zip(totals, weight_lists)]
+
+    counts = [len(weights) for weights in weight_lists]
+    owners = np.repeat(np.arange(len(totals)), counts)
+    flat = [weight for weights in weight_lists for weight in weights]
+    try:
+        parts = allocate_batch(totals, owners, flat).tolist()
+    except OverflowError:
+        return [allocate(total, weights) for total, weights in zip(totals, weight_lists)]
+
+    result, start = [], 0
+    for count in counts:
+        result.append(parts[start:start + count])
+        start += count
+    return result
+
+
+def _integer_weights(values):
+    """Scale positive decimal values to proportional integers"""
+    fractions = [Fraction(_decimal(value)) for value in values]
+    if any(value < 0 for value in fractions):
+        raise MoneyError('Split values cannot be negative')
+    scale = lcm(*(value.denominator for value in fractions))
+    weights = [int(value * scale) for value in fractions]
+    divisor = gcd(*weights) or 1
+    return [weight // divisor for weight in weights]
+
+
+def split_weights(method, total, values, currency):
+    """Reduce any split method to integer weights for :func:`allocate`
+
+    ``values`` holds one entry per participant: ignored for ``equal``,
+    percentages for ``percentage``, relative shares for ``shares`` and
+    major-unit amounts for ``exact``.
+    """
+    if method == 'equal':
+        return [1] * len(values)
+    if method == 'percentage':
+        if sum(_decimal(value) for value in values) != 100:
+            raise MoneyError('Percentages must add up to 100')
+        return _integer_weights(values)
+    if method == 'shares':
+        return _integer_weights(values)
+    if method == 'exact':
+        amounts = [to_minor(value, currency) for value in values]
+        if any(amount > MAX_MINOR for amount in amounts):
+            raise MoneyError('Split values are too large')
+        if sum(amounts) != total:
+            raise MoneyError('Exact split amounts must add up to the expense amount')
+        if any(amount < 0 for amount in amounts):
+            raise MoneyError('Split values cannot be negative')
+        return amounts
+    raise MoneyError(f"split must be one of {', '.join(SPLIT_METHODS)}")
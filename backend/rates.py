@@ -0,0 +1,68 @@
+import csv
+from bisect import bisect_right
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from functools import lru_cache
+from money import exponent
+
+
+class RateError(ValueError):
+    """Raised when no exchange rate is available for a conversion"""
+
+
+class RateTable:
+    """Date-keyed exchange rates into a single base currency
+
+    Rates are loaded from a CSV file with ``date,currency,rate`` columns,
+    where ``rate`` is the value of one unit of ``currency`` in the base
+    currency on that date. A conversion uses the most recent rate on or
+    before the expense date. Lookups are memoized per ``(currency, date)``
+    so replaying a large ledger only searches the table once per distinct
+    currency and day.
+    """
+
+    def __init__(self, base, path=None, cache_size=4096):
+        self.base = base
+        self._dates = {}
+        self._rates = {}
+        self.rate = lru_cache(maxsize=cache_size)(self._lookup)
+        if path:
+            self.load(path)
+
+    def load(self, path):
+        """Replace the table with the rates in a CSV file"""
+        rows = {}
+        with open(path, newline='') as f:
+            for number, record in enumerate(csv.DictReader(f), start=2):
+                try:
+                    day = record['date'].strip()[:10]
+                    currency = record['currency'].strip().upper()
+                    rate = Decimal(record['rate'].strip())
+                except (KeyError, AttributeError, InvalidOperation):
+                    raise RateError(f'{path}:{number}: expected date,currency,rate')
+                rows.setdefault(currency, {})[day] = rate
+
+        self._dates, self._rates = {}, {}
+        for currency, by_day in rows.items():
+            days = sorted(by_day)
+            self._dates[currency] = days
+            self._rates[currency] = [by_day[day] for day in days]
+        self.rate.cache_clear()
+
+    def _lookup(self, currency, day):
+        """Value of one unit of currency in the base currency on a given day"""
+        if currency == self.base:
+            return Decimal(1)
+        days = self._dates.get(currency)
+        if not days:
+            raise RateError(f'No exchange rates for {currency}')
+        index = bisect_right(days, day) - 1
+        if index < 0:
+            raise RateError(f'No {currency} exchange rate on or before {day}')
+        return self._rates[currency][index]
+
+    def convert(self, minor, currency, day):
+        """Convert minor units of currency into minor units of the base currency"""
+        if currency == self.base:
+            return minor
+        value = Decimal(minor).scaleb(exponent(self.base) - exponent(currency)) * self.rate(currency, day)
+        return int(value.to_integral_value(ROUND_HALF_EVEN))
@@ -0,0 +1,250 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from calendar import monthrange
+from datetime import datetime, timedelta, timezone
+from ledger import ExpenseError
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+# Rule ids per IN (...) lookup, well under SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+
+class RecurringError(ValueError):
+    """Raised for invalid recurring expense rules"""
+
+
+def _parse_time(value, name):
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise RecurringError(f'{name} must be an ISO 8601 date or time')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def occurrence(start, frequency, every, n):
+    """Date of the n-th occurrence (from 0) of a rule starting at ``start``
+
+    Occurrences are always computed from the start rather than from the
+    previous one, so a rule starting on the 31st lands on the last day of
+    shorter months without drifting to the 28th for the rest of the year.
+    """
+    if frequency == 'daily':
+        return start + timedelta(days=every * n)
+    if frequency == 'weekly':
+        return start + timedelta(weeks=every * n)
+    months = every * n * (12 if frequency == 'yearly' else 1)
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    day = min(start.day, monthrange(year, month + 1)[1])
+    return start.replace(year=year, month=month + 1, day=day)
+
+
+class RecurringRules:
+    """Recurring expense rules materialized into the ledger on a schedule
+
+    Active rules are kept in a min-heap ordered by their next due time, so
+    each :meth:`run_due` only touches the rules that are actually due. All
+    occurrences due in a tick are written in one transaction that holds the
+    database write lock and re-reads each rule, so several workers can run
+    the scheduler without creating an occurrence twice. The heap is
+    reloaded from the database every ``resync_seconds`` to pick up rules
+    created by other workers.
+    """
+
+    def __init__(self, ledger, validate=None, resync_seconds=300):
+        self.ledger = ledger
+        self.validate = validate or ledger.normalize
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._heap = []
+        self._loaded_at = None
+        self.scheduler = None
+
+    def load(self):
+        """Rebuild the due-time heap from the database"""
+        heap = [(row['next_due'], row['id']) for row in self.ledger.conn.execute(
+            'SELECT id, next_due FROM recurring_rules WHERE next_due IS NOT NULL'
+        )]
+        heapq.heapify(heap)
+        with self._lock:
+            self._heap = heap
+            self._loaded_at = time.monotonic()
+
+    def create(self, data):
+        """Validate and store a rule, returning it with its id"""
+        if not isinstance(data, dict):
+            raise RecurringError('Rule must be a JSON object')
+        template = data.get('expense')
+        if not isinstance(template, dict):
+            raise RecurringError('expense must be an expense object')
+        frequency = data.get('frequency')
+        if frequency not in FREQUENCIES:
+            raise RecurringError(f"frequency must be one of {', '.join(FREQUENCIES)}")
+        try:
+            every = int(data.get('every', 1))
+        except (TypeError, ValueError):
+            every = 0
+        if every < 1:
+            raise RecurringError('every must be a positive integer')
+        starts_at = _parse_time(data['start'], 'start') if data.get('start') else datetime.utcnow()
+        ends_at = _parse_time(data['end'], 'end') if data.get('end') else None
+        if ends_at is not None and len(str(data['end'])) == 10:
+            # A bare end date includes occurrences later that day
+            ends_at = ends_at.replace(hour=23, minute=59, second=59, microsecond=999999)
+        if ends_at is not None and ends_at < starts_at:
+            raise RecurringError('end must not be before start')
+
+        template = {key: value for key, value in template.items() if key not in ('id', 'date')}
+        # Fail now rather than on every tick if the template is unusable
+        try:
+            self.validate({**template, 'date': starts_at.isoformat()})
+        except ExpenseError as e:
+            raise RecurringError(f'Invalid expense: {e}') from e
+
+        rule = {
+            'expense': template,
+            'frequency': frequency,
+            'every': every,
+            'start': starts_at.isoformat(),
+            'end': ends_at.isoformat() if ends_at else None,
+            'occurrences': 0,
+            'next_due': starts_at.isoformat(),
+            'created_at': datetime.utcnow().isoformat(),
+        }
+        with self.ledger.write() as conn:
+            cursor = conn.execute(
+                'INSERT INTO recurring_rules '
+                '(template, frequency, every, starts_at, ends_at, next_due, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (json.dumps(template), frequency, every, rule['start'], rule['end'],
+                 rule['next_due'], rule['created_at'])
+            )
+        rule['id'] = cursor.lastrowid
+        with self._lock:
+            heapq.heappush(self._heap, (rule['next_due'], rule['id']))
+        return rule
+
+    def get(self, rule_id):
+        """Return a rule by id or None"""
+        row = self.ledger.conn.execute(
+            'SELECT * FROM recurring_rules WHERE id = ?', (rule_id,)
+        ).fetchone()
+        return self._row_to_rule(row) if row else None
+
+    def cancel(self, rule_id):
+        """Stop a rule from creating further expenses; False if there is no such rule"""
+        with self.ledger.write() as conn:
+            cursor = conn.execute(
+                'UPDATE recurring_rules SET next_due = NULL WHERE id = ?', (rule_id,)
+            )
+        # Its heap entry is dropped when it comes due and the rule is re-read
+        return cursor.rowcount > 0
+
+    def run_due(self, now=None):
+        """Create every occurrence due by ``now`` and return the new expenses"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.resync_seconds:
+            self.load()
+        now = (now or datetime.utcnow()).isoformat()
+        with self._lock:
+            due = set()
+            while self._heap and self._heap[0][0] <= now:
+                due.add(heapq.heappop(self._heap)[1])
+        if not due:
+            return []
+
+        expenses, updates = [], []
+        due = sorted(due)
+        try:
+            with self.ledger.write() as conn:
+                # Hold the write lock while reading so no other worker can
+                # materialize the same occurrences concurrently.
+                conn.execute('BEGIN IMMEDIATE')
+                for start in range(0, len(due), _LOOKUP_CHUNK):
+                    chunk = due[start:start + _LOOKUP_CHUNK]
+                    placeholders = ', '.join('?' * len(chunk))
+                    for row in conn.execute(
+                        f'SELECT * FROM recurring_rules WHERE id IN ({placeholders})', chunk
+                    ):
+                        updates.append(self._materialize(row, now, expenses))
+                self.ledger.record_expenses(conn, expenses)
+                conn.executemany(
+                    'UPDATE recurring_rules SET occurrences = ?, next_due = ? WHERE id = ?',
+                    updates
+                )
+        except Exception:
+            # Put the rules back so the next tick retries them
+            with self._lock:
+                for rule_id in due:
+                    heapq.heappush(self._heap, (now, rule_id))
+            raise
+
+        with self._lock:
+            for _, next_due, rule_id in updates:
+                if next_due is not None:
+                    heapq.heappush(self._heap, (next_due, rule_id))
+        return expenses
+
+    def _materialize(self, row, now, expenses):
+        """Append a rule's due occurrences to expenses and return its new state"""
+        rule = self._row_to_rule(row)
+        start = datetime.fromisoformat(rule['start'])
+        count, next_due = rule['occurrences'], rule['next_due']
+        while next_due is not None and next_due <= now:
+            try:
+                expense = self.validate({**rule['expense'], 'date': next_due})
+            except ExpenseError as e:
+                logger.warning('Skipping occurrence %s of recurring rule %s: %s',
+                               next_due, rule['id'], e)
+            else:
+                expense['recurring_rule'] = rule['id']
+                expenses.append(expense)
+            count += 1
+            next_due = occurrence(start, rule['frequency'], rule['every'], count).isoformat()
+            if rule['end'] is not None and next_due > rule['end']:
+                next_due = None
+        return count, next_due, rule['id']
+
+    def start(self, interval_seconds):
+        """Run :meth:`run_due` every ``interval_seconds`` on a background scheduler"""
+        from apscheduler.schedulers.background import BackgroundScheduler
+        self.scheduler = BackgroundScheduler(daemon=True)
+        self.scheduler.add_job(
+            self._tick,
+            'interval',
+            seconds=interval_seconds,
+            id='recurring_expenses',
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.start()
+
+    def _tick(self):
+        try:
+            created = self.run_due()
+        except Exception:
+            logger.exception('Recurring expense tick failed')
+            return
+        if created:
+            logger.info('Created %d recurring expense(s)', len(created))
+
+    @staticmethod
+    def _row_to_rule(row):
+        return {
+            'id': row['id'],
+            'expense': json.loads(row['template']),
+            'frequency': row['frequency'],
+            'every': row['every'],
+            'start': row['starts_at'],
+            'end': row['ends_at'],
+            'occurrences': row['occurrences'],
+            'next_due': row['next_due'],
+            'created_at': row['created_at'],
+        }
@@ -0,0 +1,169 @@
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from ledger import ExpenseError
+
+
+class RegistryError(ValueError):
+    """Raised for invalid user and group changes"""
+
+
+class DuplicateUserError(RegistryError):
+    """Raised when registering an email that is already taken"""
+
+
+class Registry:
+    """Users and groups with stable ids, stored in the ledger database
+
+    Known user ids and group member sets are cached in memory, so checking
+    that every participant of an expense exists and belongs to its group is
+    a handful of set operations rather than a scan per participant. Caches
+    only ever grow; a miss falls back to the database, which also picks up
+    users and members added by other worker processes.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self._user_ids = set()
+        self._members = {}
+
+    def register_user(self, data):
+        """Create a user from a registration payload and return it with its id"""
+        if not isinstance(data, dict):
+            raise RegistryError('User must be a JSON object')
+        email = str(data.get('email') or '').strip().lower()
+        if '@' not in email:
+            raise RegistryError('A valid email is required')
+
+        user = dict(data)
+        user.update({
+            'id': uuid.uuid4().hex,
+            'email': email,
+            'name': data.get('name') or data.get('username') or email.split('@')[0],
+            'created_at': datetime.utcnow().isoformat(),
+        })
+        user.pop('password', None)
+        try:
+            with self.ledger.write() as conn:
+                conn.execute(
+                    'INSERT INTO users (id, email, name, data, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (user['id'], email, user['name'], json.dumps(user), user['created_at'])
+                )
+        except sqlite3.IntegrityError:
+            raise DuplicateUserError(f'{email} is already registered')
+        with self._lock:
+            self._user_ids.add(user['id'])
+        return user
+
+    def get_user(self, user_id):
+        """Return a user by id or None"""
+        row = self.ledger.conn.execute('SELECT data FROM users WHERE id = ?', (user_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def find_user_by_email(self, email):
+        """Return a user by email (case-insensitive) or None"""
+        row = self.ledger.conn.execute(
+            'SELECT data FROM users WHERE email = ?', (email.strip().lower(),)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def unknown_users(self, user_ids):
+        """Return the subset of user_ids that are not registered"""
+        with self._lock:
+            missing = set(user_ids) - self._user_ids
+        if not missing:
+            return set()
+        placeholders = ', '.join('?' * len(missing))
+        found = {row['id'] for row in self.ledger.conn.execute(
+            f'SELECT id FROM users WHERE id IN ({placeholders})', list(missing)
+        )}
+        with self._lock:
+            self._user_ids |= found
+        return missing - found
+
+    def create_group(self, name, members=()):
+        """Create a group with an initial member list"""
+        if not name:
+            raise RegistryError('Group name is required')
+        unknown = self.unknown_users({str(user_id) for user_id in members})
+        if unknown:
+            raise RegistryError(f"Unknown user(s): {', '.join(sorted(unknown))}")
+        group = {
+            'id': uuid.uuid4().hex,
+            'name': name,
+            'created_at': datetime.utcnow().isoformat(),
+        }
+        with self.ledger.write() as conn:
+            conn.execute(
+                'INSERT INTO user_groups (id, name, created_at) VALUES (?, ?, ?)',
+                (group['id'], name, group['created_at'])
+            )
+        self.add_members(group['id'], members)
+        group['members'] = sorted(self.members(group['id']))
+        return group
+
+    def get_group(self, group_id):
+        """Return a group with its members or None"""
+        row = self.ledger.conn.execute(
+            'SELECT id, name, created_at FROM user_groups WHERE id = ?', (group_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        group = dict(row)
+        group['members'] = sorted(self.members(group_id))
+        return group
+
+    def add_members(self, group_id, user_ids):
+        """Add registered users to a group; existing members are ignored"""
+        user_ids = {str(user_id) for user_id in user_ids}
+        unknown = self.unknown_users(user_ids)
+        if unknown:
+            raise RegistryError(f"Unknown user(s): {', '.join(sorted(unknown))}")
+        with self.ledger.write() as conn:
+            if conn.execute('SELECT 1 FROM user_groups WHERE id = ?', (group_id,)).fetchone() is None:
+                raise RegistryError(f'Unknown group: {group_id}')
+            conn.executemany(
+                'INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)',
+                [(group_id, user_id) for user_id in user_ids]
+            )
+        with self._lock:
+            if group_id in self._members:
+                self._members[group_id] |= user_ids
+
+    def members(self, group_id, refresh=False):
+        """Return the cached set of member ids for a group"""
+        with self._lock:
+            members = self._members.get(group_id)
+        if members is None or refresh:
+            members = {row['user_id'] for row in self.ledger.conn.execute(
+                'SELECT user_id FROM group_members WHERE group_id = ?', (group_id,)
+            )}
+            with self._lock:
+                self._members[group_id] = members
+        return members
+
+    def groups_for(self, user_id):
+        """Return the ids of the groups a user belongs to"""
+        return [row['group_id'] for row in self.ledger.conn.execute(
+            'SELECT group_id FROM group_members WHERE user_id = ?', (user_id,)
+        )]
+
+    def check_expense(self, expense):
+        """Raise ExpenseError unless everyone on an expense may take part in it"""
+        involved = {expense['paid_by'], *expense['participants']}
+        unknown = self.unknown_users(involved)
+        if unknown:
+            raise ExpenseError(f"Unknown user(s): {', '.join(sorted(unknown))}")
+
+        group = expense['group']
+        if group is None:
+            return
+        outsiders = involved - self.members(group)
+        if outsiders:
+            # Another worker may have added them since we cached the group
+            outsiders = involved - self.members(group, refresh=True)
+        if outsiders:
+            raise ExpenseError(f"Not member(s) of group {group}: {', '.join(sorted(outsiders))}")
@@ -0,0 +1,159 @@
+import heapq
+import time
+
+# Largest group the exact solver will attempt; it is exponential in the
+# number of users with a non-zero balance.
+EXACT_MAX_USERS = 12
+
+# How many loop iterations run between deadline checks
+_CHECK_EVERY = 256
+
+
+class SettleTimeout(Exception):
+    """Raised when a solver runs past its deadline"""
+
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise SettleTimeout()
+
+
+def _greedy(balances, deadline=None):
+    """Match the largest creditor with the largest debtor until all are settled"""
+    start = time.monotonic()
+    creditors, debtors = [], []
+    for count, (user, amount) in enumerate(balances.items()):
+        if count % _CHECK_EVERY == 0:
+            _check_deadline(deadline)
+        if amount > 0:
+            creditors.append((-amount, user))
+        elif amount < 0:
+            debtors.append((amount, user))
+    # heapify cannot be interrupted, but takes less time than the loop that
+    # built its input, so only start it if that much of the budget is left
+    if deadline is not None and 2 * time.monotonic() - start > deadline:
+        raise SettleTimeout()
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        if len(transfers) % _CHECK_EVERY == 0:
+            _check_deadline(deadline)
+        credit, creditor = heapq.heappop(creditors)
+        debt, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, amount))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+    return transfers
+
+
+def _exact(balances, deadline=None):
+    """Minimum number of transfers via the zero-sum subset partition
+
+    The fewest transfers needed to settle n users is n minus the largest
+    number of disjoint groups whose balances sum to zero, and each such
+    group of k users can always be settled with k - 1 transfers.
+    """
+    users = sorted(balances)
+    amounts = [balances[user] for user in users]
+    size = 1 << len(users)
+
+    # total[mask] is the balance sum of the users in mask; groups[mask] the
+    # most zero-sum groups mask can be split into.
+    total = [0] * size
+    groups = [0] * size
+    for mask in range(1, size):
+        if mask % _CHECK_EVERY == 0:
+            _check_deadline(deadline)
+        low = mask & -mask
+        total[mask] = total[mask ^ low] + amounts[low.bit_length() - 1]
+        best = 0
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            best = max(best, groups[mask ^ bit])
+            rest ^= bit
+        groups[mask] = best + (total[mask] == 0)
+
+    # Walk back from the full set to recover an insertion order whose zero
+    # prefix sums mark the boundaries of the groups.
+    order = []
+    mask = size - 1
+    while mask:
+        target = groups[mask] - (total[mask] == 0)
+        rest = mask
+        while rest:
+            bit = rest & -rest
+            if groups[mask ^ bit] == target:
+                break
+            rest ^= bit
+        order.append(bit.bit_length() - 1)
+        mask ^= bit
+    order.reverse()
+
+    transfers = []
+    group, running = {}, 0
+    for index in order:
+        group[users[index]] = amounts[index]
+        running += amounts[index]
+        if running == 0:
+            transfers.extend(_greedy(group, deadline))
+            group = {}
+    return transfers
+
+
+def settle(balances, method='auto', budget_ms=None, exact_max_users=EXACT_MAX_USERS):
+    """Turn {user: net balance} into a list of transfers that settles everyone
+
+    Balances are integer minor units and must sum to zero.
+
+    ``method`` is ``'greedy'``, ``'exact'`` or ``'auto'``. The exact solver is
+    only used for groups of at most ``exact_max_users`` users and gets half of
+    ``budget_ms``; if it runs out of time the greedy result is returned
+    instead. If even that cannot finish within the budget a
+    :class:`SettleTimeout` is raised.
+
+    Returns ``(transfers, method_used)`` where each transfer is a dict with
+    ``from``, ``to`` and ``amount`` (minor units) keys.
+    """
+    if method not in ('auto', 'greedy', 'exact'):
+        raise ValueError(f'Unknown settle method: {method}')
+
+    deadline = exact_deadline = None
+    if budget_ms is not None:
+        start = time.monotonic()
+        deadline = start + budget_ms / 1000
+        exact_deadline = start + budget_ms / 2000
+
+    # Large groups take a while just to read, so the deadline is checked
+    # from the start rather than only once a solver runs
+    nonzero, total = {}, 0
+    for count, (user, amount) in enumerate(balances.items()):
+        if count % _CHECK_EVERY == 0:
+            _check_deadline(deadline)
+        if amount:
+            nonzero[user] = amount
+            total += amount
+    if total != 0:
+        raise ValueError('Balances must sum to zero')
+    balances = nonzero
+
+    if method == 'auto' or len(balances) > exact_max_users:
+        method = 'exact' if len(balances) <= exact_max_users else 'greedy'
+
+    if method == 'exact':
+        try:
+            transfers = _exact(balances, exact_deadline)
+        except SettleTimeout:
+            method = 'greedy'
+    if method == 'greedy':
+        transfers = _greedy(balances, deadline)
+
+    return [
+        {'from': debtor, 'to': creditor, 'amount': amount}
+        for debtor, creditor, amount in transfers
+    ], method
@@ -81,6 +81,12 @@ swagger_template = {
             'in': 'query',
             'type': 'string',
             'description': 'Search query'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'description': 'meta.next_cursor from the previous page; takes precedence over page'
         }
     ],
     'responses': {
@@ -100,11 +106,16 @@ swagger_template = {
                         'properties': {
                             'total': {'type': 'integer'},
                             'page': {'type': 'integer'},
-                            'pages': {'type': 'integer'}
+                            'pages': {'type': 'integer'},
+                            'limit': {'type': 'integer'},
+                            'next_cursor': {'type': 'string'}
                         }
                     }
                 }
             }
+        },
+        304: {
+            'description': 'Not modified since the ETag (If-None-Match) the client sent'
         }
     }
 })
@@ -132,6 +143,9 @@ def get_posts():
                 '$ref': '#/definitions/Post'
             }
         },
+        304: {
+            'description': 'Not modified since the ETag (If-None-Match) or Last-Modified (If-Modified-Since) the client sent'
+        },
         404: {
             'description': 'Post not found'
         }
@@ -141,6 +155,90 @@ def get_post(slug):
     """Get a single blog post by slug"""
     pass
 
+@api_docs.route('/api/post/<int:id>/share', methods=['POST'])
+@swag_from({
+    'tags': ['Posts'],
+    'summary': 'Count a share of a blog post',
+    'parameters': [
+        {
+            'name': 'id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': 'Post ID'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Share count including this share',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'share_count': {'type': 'integer'}
+                }
+            }
+        },
+        404: {
+            'description': 'Post not found'
+        }
+    }
+})
+def share_post(id):
+    """Increment a post's share count"""
+    pass
+
+@api_docs.route('/api/search', methods=['GET'])
+@swag_from({
+    'tags': ['Search'],
+    'summary': 'Search posts and podcasts',
+    'parameters': [
+        {
+            'name': 'q',
+            'in': 'query',
+            'type': 'string',
+            'required': True,
+            'description': 'Words to match; the last word also matches as a prefix'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'default': 10,
+            'description': 'Most results of each kind'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Best-ranked published posts and podcasts. Titles and snippets are HTML-escaped with matches wrapped in <mark>.',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'posts': {
+                        'type': 'array',
+                        'items': {'$ref': '#/definitions/SearchResult'}
+                    },
+                    'podcasts': {
+                        'type': 'array',
+                        'items': {'$ref': '#/definitions/SearchResult'}
+                    }
+                }
+            }
+        },
+        304: {
+            'description': 'Not modified since the ETag (If-None-Match) the client sent'
+        },
+        400: {
+            'description': 'Missing or invalid query'
+        },
+        503: {
+            'description': 'Search index has not been built'
+        }
+    }
+})
+def search():
+    """Full-text search over posts and podcasts"""
+    pass
+
 @api_docs.route('/api/categories', methods=['GET'])
 @swag_from({
     'tags': ['Categories'],
@@ -239,5 +337,18 @@ definitions = {
             'name': {'type': 'string'},
             'slug': {'type': 'string'}
         }
+    },
+    'SearchResult': {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'integer'},
+            'slug': {'type': 'string'},
+            'audio_file': {'type': 'string'},
+            'title': {'type': 'string'},
+            'snippet': {'type': 'string'},
+            'score': {'type': 'number'},
+            'created_at': {'type': 'string', 'format': 'date-time'},
+            'published_at': {'type': 'string', 'format': 'date-time'}
+        }
     }
 }
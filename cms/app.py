@@ -1,11 +1,23 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask_migrate import Migrate, stamp, upgrade
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+import hashlib
 import os
 from datetime import datetime
-from models import db, User, Post, Category, Tag, Media, Podcast
+from models import db, User, Post, Category, Tag, Media, Podcast, post_tags
 from forms import PostForm, CategoryForm, TagForm, UserForm, PodcastForm
+from serializers import post_detail_options, post_list_options, serialize_post
+from utils.counter_buffer import CounterBuffer
+from utils.database import configure_sqlite, database_uri, engine_options
+from utils.query_counter import count_queries
+from utils.response_cache import ResponseCache
+from utils.search_index import SearchIndex, match_query
+from utils.static_site import StaticSite
+from sqlalchemy import and_, case, func, inspect, or_, select
+from sqlalchemy.orm import joinedload, load_only
+import click
 import whisper
 from pydub import AudioSegment
 import tempfile
@@ -13,7 +25,21 @@ import logging
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///blog.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(os.getenv('DATABASE_URL'))
+# Connection pool per worker process (ignored for in-memory SQLite)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'],
+    pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+    max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+    pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+    pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800'))
+)
+# Pragmas for every SQLite connection (see utils/database.py for the rest)
+app.config['SQLITE_PRAGMAS'] = {
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+}
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
 PODCAST_FOLDER = os.path.join(UPLOAD_FOLDER, 'podcasts')
@@ -25,20 +51,72 @@ os.makedirs(PODCAST_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024  # 64MB max file size
 
+# Default and maximum page sizes for /api/posts
+app.config['API_PAGE_SIZE'] = int(os.getenv('API_PAGE_SIZE', '10'))
+app.config['API_MAX_PAGE_SIZE'] = int(os.getenv('API_MAX_PAGE_SIZE', '100'))
+
+# Public site that build-static renders published posts into (the
+# repository root, next to index.html and blogs/, unless overridden)
+app.config['SITE_URL'] = os.getenv('SITE_URL', 'https://spiritofthedeal.com')
+app.config['STATIC_SITE_DIR'] = os.getenv('STATIC_SITE_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Rows per page in the admin listings
+app.config['ADMIN_PAGE_SIZE'] = int(os.getenv('ADMIN_PAGE_SIZE', '50'))
+
+# Public API response cache: memory (per worker), redis (shared) or none
+app.config['RESPONSE_CACHE_BACKEND'] = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+app.config['RESPONSE_CACHE_REDIS_URL'] = os.getenv('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', '256'))
+app.config['RESPONSE_CACHE_TIMEOUT'] = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+
+# View and share counts are buffered in memory and written in batches
+app.config['COUNTER_FLUSH_SECONDS'] = float(os.getenv('COUNTER_FLUSH_SECONDS', '5'))
+app.config['COUNTER_FLUSH_EVENTS'] = int(os.getenv('COUNTER_FLUSH_EVENTS', '100'))
+
 db.init_app(app)
+with app.app_context():
+    configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+# Batch mode lets migrations alter SQLite tables by copying them
+migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'),
+                  render_as_batch=True)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+response_cache = ResponseCache(app)
+search_index = SearchIndex(db)
+post_counters = CounterBuffer(app, db, Post.__table__,
+                              flush_seconds=app.config['COUNTER_FLUSH_SECONDS'],
+                              flush_events=app.config['COUNTER_FLUSH_EVENTS'])
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+def _admin_page(query):
+    return query.paginate(page=request.args.get('page', 1, type=int),
+                          per_page=app.config['ADMIN_PAGE_SIZE'], error_out=False)
+
+def _post_stats():
+    total, published, views = db.session.query(
+        func.count(Post.id),
+        func.coalesce(func.sum(case((Post.published.is_(True), 1), else_=0)), 0),
+        func.coalesce(func.sum(Post.views), 0)
+    ).one()
+    return {'total': total, 'published': published, 'drafts': total - published, 'views': views}
+
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return render_template('admin/dashboard.html', posts=posts)
+    # Only the columns the listing shows; content stays in the database
+    posts = _admin_page(Post.query.options(
+        load_only(Post.id, Post.title, Post.published, Post.views, Post.created_at),
+        joinedload(Post.author).load_only(User.username),
+        joinedload(Post.category).load_only(Category.name)
+    ).order_by(Post.created_at.desc(), Post.id.desc()))
+    # Counts are cleared with the response cache whenever posts change;
+    # views buffered since then show up once the cache expires
+    stats = response_cache.memoize('admin-post-stats', _post_stats)
+    return render_template('admin/dashboard.html', posts=posts, stats=stats)
 
 @app.route('/admin/post/new', methods=['GET', 'POST'])
 @login_required
@@ -70,6 +148,7 @@ def new_post():
 
         db.session.add(post)
         db.session.commit()
+        response_cache.invalidate()
         flash('Post created successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
 
@@ -102,6 +181,7 @@ def edit_post(id):
         post.tags = Tag.query.filter(Tag.id.in_(form.tags.data)).all()
 
         db.session.commit()
+        response_cache.invalidate()
         flash('Post updated successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
 
@@ -114,15 +194,27 @@ def delete_post(id):
     post = Post.query.get_or_404(id)
     db.session.delete(post)
     db.session.commit()
+    response_cache.invalidate()
     flash('Post deleted successfully!', 'success')
     return redirect(url_for('admin_dashboard'))
 
+def _touch_posts(*criteria):
+    """Bump updated_at of posts that show a renamed or removed category or tag
+
+    API validators and static pages are derived from updated_at, so the
+    posts must look changed for clients and builds to pick up the new name.
+    """
+    Post.query.filter(*criteria).update({Post.updated_at: datetime.utcnow()}, synchronize_session=False)
+
 @app.route('/admin/categories')
 @login_required
 def categories():
-    categories = Category.query.all()
+    categories = _admin_page(Category.query.order_by(Category.name))
+    post_counts = response_cache.memoize('admin-category-post-counts', lambda: dict(
+        db.session.query(Post.category_id, func.count(Post.id)).group_by(Post.category_id).all()
+    ))
     form = CategoryForm()  
-    return render_template('admin/categories.html', categories=categories, form=form)
+    return render_template('admin/categories.html', categories=categories, post_counts=post_counts, form=form)
 
 @app.route('/admin/category/new', methods=['POST'])
 @login_required
@@ -132,6 +224,7 @@ def new_category():
         category = Category(name=form.name.data, description=form.description.data)
         db.session.add(category)
         db.session.commit()
+        response_cache.invalidate()
         flash('Category created successfully!', 'success')
         return redirect(url_for('categories'))
     flash('Error creating category. Please check the form.', 'danger')
@@ -143,9 +236,12 @@ def edit_category(id):
     category = Category.query.get_or_404(id)
     form = CategoryForm()
     if form.validate_on_submit():
+        if category.name != form.name.data:
+            _touch_posts(Post.category_id == category.id)
         category.name = form.name.data
         category.description = form.description.data
         db.session.commit()
+        response_cache.invalidate()
         flash('Category updated successfully!', 'success')
     else:
         flash('Error updating category. Please check the form.', 'danger')
@@ -155,17 +251,22 @@ def edit_category(id):
 @login_required
 def delete_category(id):
     category = Category.query.get_or_404(id)
+    _touch_posts(Post.category_id == category.id)
     db.session.delete(category)
     db.session.commit()
+    response_cache.invalidate()
     flash('Category deleted successfully!', 'success')
     return redirect(url_for('categories'))
 
 @app.route('/admin/tags')
 @login_required
 def tags():
-    tags = Tag.query.all()
+    tags = _admin_page(Tag.query.order_by(Tag.name))
+    post_counts = response_cache.memoize('admin-tag-post-counts', lambda: dict(
+        db.session.query(post_tags.c.tag_id, func.count()).group_by(post_tags.c.tag_id).all()
+    ))
     form = TagForm()  
-    return render_template('admin/tags.html', tags=tags, form=form)
+    return render_template('admin/tags.html', tags=tags, post_counts=post_counts, form=form)
 
 @app.route('/admin/tag/new', methods=['POST'])
 @login_required
@@ -175,6 +276,7 @@ def new_tag():
         tag = Tag(name=form.name.data)
         db.session.add(tag)
         db.session.commit()
+        response_cache.invalidate()
         flash('Tag created successfully!', 'success')
         return redirect(url_for('tags'))
     flash('Error creating tag. Please check the form.', 'danger')
@@ -186,8 +288,11 @@ def edit_tag(id):
     tag = Tag.query.get_or_404(id)
     form = TagForm()
     if form.validate_on_submit():
+        if tag.name != form.name.data:
+            _touch_posts(Post.id.in_(select(post_tags.c.post_id).where(post_tags.c.tag_id == tag.id)))
         tag.name = form.name.data
         db.session.commit()
+        response_cache.invalidate()
         flash('Tag updated successfully!', 'success')
     else:
         flash('Error updating tag. Please check the form.', 'danger')
@@ -197,15 +302,20 @@ def edit_tag(id):
 @login_required
 def delete_tag(id):
     tag = Tag.query.get_or_404(id)
+    _touch_posts(Post.id.in_(select(post_tags.c.post_id).where(post_tags.c.tag_id == tag.id)))
     db.session.delete(tag)
     db.session.commit()
+    response_cache.invalidate()
     flash('Tag deleted successfully!', 'success')
     return redirect(url_for('tags'))
 
 @app.route('/admin/podcasts')
 @login_required
 def podcasts():
-    podcasts = Podcast.query.order_by(Podcast.published_at.desc()).all()
+    podcasts = _admin_page(Podcast.query.options(
+        load_only(Podcast.id, Podcast.title, Podcast.description, Podcast.audio_file,
+                  Podcast.duration, Podcast.published_at)
+    ).order_by(Podcast.published_at.desc(), Podcast.id.desc()))
     form = PodcastForm()
     return render_template('admin/podcasts.html', podcasts=podcasts, form=form)
 
@@ -317,6 +427,7 @@ def new_podcast():
             )
             db.session.add(podcast)
             db.session.commit()
+            response_cache.invalidate()
             flash('Podcast created successfully!', 'success')
             
         except Exception as e:
@@ -347,6 +458,7 @@ def edit_podcast(id):
         podcast.duration = form.duration.data
         podcast.published_at = form.published_at.data
         db.session.commit()
+        response_cache.invalidate()
         flash('Podcast updated successfully!', 'success')
     else:
         flash('Error updating podcast. Please check the form.', 'danger')
@@ -363,6 +475,7 @@ def delete_podcast(id):
         pass  # File might not exist
     db.session.delete(podcast)
     db.session.commit()
+    response_cache.invalidate()
     flash('Podcast deleted successfully!', 'success')
     return redirect(url_for('podcasts'))
 
@@ -383,42 +496,287 @@ def logout():
     return redirect(url_for('login'))
 
 # API endpoints for frontend integration
+def _filtered_posts(category=None, tag=None, search=None):
+    """Published posts matching the public API's filters, unordered"""
+    query = Post.query.filter_by(published=True)
+    if category:
+        query = query.filter(
+            Post.category_id == select(Category.id).where(Category.slug == category).scalar_subquery()
+        )
+    if tag:
+        query = query.filter(Post.id.in_(
+            select(post_tags.c.post_id).join(Tag, Tag.id == post_tags.c.tag_id).where(Tag.slug == tag)
+        ))
+    if search and search_index.available:
+        query = query.filter(Post.id.in_(search_index.post_ids(match_query(search))))
+    elif search:
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(or_(
+            Post.title.ilike(pattern, escape='\\'),
+            Post.excerpt.ilike(pattern, escape='\\'),
+            Post.search_text.ilike(pattern, escape='\\')
+        ))
+    return query
+
+def _parse_cursor(cursor):
+    """Split a ``<created_at>_<id>`` keyset cursor"""
+    created_at, _, post_id = cursor.rpartition('_')
+    post_id = int(post_id)
+    if not 0 < post_id < 2 ** 63:
+        raise ValueError(f'Post id out of range: {post_id}')
+    return datetime.fromisoformat(created_at), post_id
+
+def _etag(*parts):
+    """Strong validator for a response built from ``parts``"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def _not_modified(etag, last_modified):
+    """A 304 response when the client already has this version, else None"""
+    if not (request.if_none_match or request.if_modified_since):
+        return None
+    response = _with_validators(app.response_class(), etag, last_modified).make_conditional(request)
+    return response if response.status_code == 304 else None
+
+def _with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    # Werkzeug turns a None last_modified into the current time
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Clients and CDNs may keep the response but must revalidate it
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/api/posts')
+@response_cache.cached
 def api_posts():
-    posts = Post.query.filter_by(published=True).order_by(Post.created_at.desc()).all()
-    return jsonify([{
-        'id': post.id,
-        'title': post.title,
-        'slug': post.slug,
-        'excerpt': post.excerpt,
-        'featured_image': post.featured_image,
-        'author': post.author.username,
-        'category': post.category.name if post.category else None,
-        'tags': [tag.name for tag in post.tags],
-        'created_at': post.created_at.isoformat(),
-        'views': post.views,
-        'share_count': post.share_count
-    } for post in posts])
+    args = request.args
+    try:
+        page = max(1, int(args.get('page', 1)))
+        limit = int(args.get('limit', app.config['API_PAGE_SIZE']))
+        cursor = _parse_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameter'}), 400
+    limit = max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+    filters = {
+        'category': args.get('category') or None,
+        'tag': args.get('tag') or None,
+        'search': args.get('search', '').strip() or None,
+    }
+
+    # Totals only change when posts do, so they are cached per filter set
+    # and shared by every page of the same listing.
+    total = response_cache.memoize(
+        f'post-count:{sorted(filters.items())}',
+        lambda: _filtered_posts(**filters).with_entities(func.count(Post.id)).scalar()
+    )
+    pages = -(-total // limit)
+    # Past the last page is the last page; this also keeps OFFSET bindable
+    page = min(page, max(1, pages))
+
+    # Newest first, with id breaking ties so the order (and the cursor) is stable
+    query = _filtered_posts(**filters).order_by(Post.created_at.desc(), Post.id.desc())
+    if cursor is not None:
+        created_at, post_id = cursor
+        query = query.filter(or_(
+            Post.created_at < created_at,
+            and_(Post.created_at == created_at, Post.id < post_id)
+        ))
+    else:
+        query = query.offset((page - 1) * limit)
+    # One extra row tells whether another page follows
+    query = query.limit(limit + 1)
+
+    # No Last-Modified: deleting or unpublishing a post changes the page
+    # without moving the newest updated_at on it, but always changes the ETag
+    def etag(versions):
+        return _etag('posts', sorted(filters.items()), total, limit, page, args.get('cursor'), versions)
+
+    # A revalidating client only costs the page's ids and update times
+    if request.if_none_match:
+        not_modified = _not_modified(etag(query.with_entities(Post.id, Post.updated_at).all()), None)
+        if not_modified is not None:
+            return not_modified
+
+    posts = query.options(*post_list_options()).all()
+    versions = [(post.id, post.updated_at) for post in posts]
+
+    next_cursor = None
+    if len(posts) > limit:
+        posts = posts[:limit]
+        next_cursor = f'{posts[-1].created_at.isoformat()}_{posts[-1].id}'
+    return _with_validators(jsonify({
+        'data': [serialize_post(post) for post in posts],
+        'meta': {
+            'total': total,
+            'page': None if cursor else page,
+            'pages': pages,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }
+    }), etag(versions))
 
 @app.route('/api/post/<slug>')
 def api_post(slug):
-    post = Post.query.filter_by(slug=slug, published=True).first_or_404()
-    post.increment_view()
-    return jsonify({
-        'id': post.id,
-        'title': post.title,
-        'content': post.content,
-        'featured_image': post.featured_image,
-        'author': post.author.username,
-        'category': post.category.name if post.category else None,
-        'tags': [tag.name for tag in post.tags],
-        'created_at': post.created_at.isoformat(),
-        'updated_at': post.updated_at.isoformat(),
-        'views': post.views,
-        'share_count': post.share_count
-    })
+    # The view and share counters are left out of the validators; they
+    # change on every read and are only written behind anyway
+    if request.if_none_match or request.if_modified_since:
+        post_id, updated_at = Post.query.with_entities(Post.id, Post.updated_at) \
+            .filter_by(slug=slug, published=True).first_or_404()
+        not_modified = _not_modified(_etag('post', post_id, updated_at), updated_at)
+        if not_modified is not None:
+            post_counters.add(post_id, 'views')
+            return not_modified
+
+    post = Post.query.options(*post_detail_options()).filter_by(slug=slug, published=True).first_or_404()
+    data = serialize_post(post, detail=True)
+    post_counters.add(post.id, 'views')
+    data['views'] = (data['views'] or 0) + post_counters.pending(post.id, 'views')
+    return _with_validators(jsonify(data), _etag('post', post.id, post.updated_at), post.updated_at)
+
+@app.route('/api/post/<int:id>/share', methods=['POST'])
+def api_post_share(id):
+    post = Post.query.filter_by(id=id, published=True).first_or_404()
+    post_counters.add(post.id, 'share_count')
+    return jsonify({'share_count': (post.share_count or 0) + post_counters.pending(post.id, 'share_count')})
+
+@app.route('/api/search')
+@response_cache.cached
+def api_search():
+    terms = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'Invalid query parameter'}), 400
+    if not terms:
+        return jsonify({'error': 'Missing search query'}), 400
+    if not search_index.available:
+        return jsonify({'error': 'Search index has not been built'}), 503
+    limit = max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+
+    # Any edit, publish or delete of a post or podcast changes these, and so
+    # does a scheduled podcast coming due. A delete can leave the newest
+    # updated_at where it was, so there is no Last-Modified to go with them.
+    now = datetime.utcnow()
+    *versions, next_due = db.session.execute(select(
+        select(func.count(Post.id)).scalar_subquery(),
+        select(func.max(Post.updated_at)).scalar_subquery(),
+        select(func.count(Podcast.id)).scalar_subquery(),
+        select(func.max(Podcast.updated_at)).scalar_subquery(),
+        select(func.max(Podcast.published_at)).where(Podcast.published_at <= now).scalar_subquery(),
+        select(func.min(Podcast.published_at)).where(Podcast.published_at > now).scalar_subquery()
+    )).one()
+    if next_due is not None:
+        response_cache.expire_within((next_due - now).total_seconds())
+    etag = _etag('search', terms, limit, tuple(versions))
+    not_modified = _not_modified(etag, None)
+    if not_modified is not None:
+        return not_modified
+    return _with_validators(jsonify(search_index.search(terms, limit=limit, now=now)), etag)
+
+# Most SQL statements each API endpoint may run, whatever the page size
+API_QUERY_BUDGETS = {
+    'api_posts': 3,
+    'api_post': 2,
+}
+
+@app.cli.command('check-query-counts')
+def check_query_counts():
+    """Fail if an API endpoint runs more queries than its budget (N+1 check)"""
+    post = Post.query.filter_by(published=True).first()
+    if post is None:
+        raise click.ClickException('Add at least one published post to check against.')
+    urls = {
+        'api_posts': '/api/posts',
+        'api_post': f'/api/post/{post.slug}',
+    }
+    client = app.test_client()
+    failed = False
+    for endpoint, url in urls.items():
+        response_cache.invalidate()
+        with count_queries(db.engine) as queries:
+            client.get(url)
+        status = 'ok' if queries.count <= API_QUERY_BUDGETS[endpoint] else 'FAIL'
+        failed = failed or status == 'FAIL'
+        click.echo(f'{status}\t{url}\t{queries.count} queries (budget {API_QUERY_BUDGETS[endpoint]})')
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index():
+    """Create the full-text search index and reindex every post and podcast"""
+    if not search_index.create():
+        raise click.ClickException('Full-text search needs an SQLite database.')
+    search_index.rebuild()
+    click.echo(f'Indexed {Post.query.count()} posts and {Podcast.query.count()} podcasts')
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Fail if a public API query scans a whole table instead of using an index"""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Query plans are only checked on SQLite.')
+    post = Post.query.options(*post_detail_options()).filter_by(published=True).first()
+    if post is None:
+        raise click.ClickException('Add at least one published post to check against.')
+    client = app.test_client()
+    first_page = client.get('/api/posts?limit=1').get_json()
+    urls = ['/api/posts', f'/api/post/{post.slug}', f'/api/posts?search={post.title.split()[0]}']
+    if first_page['meta']['next_cursor']:
+        urls.append(f"/api/posts?limit=1&cursor={first_page['meta']['next_cursor']}")
+    if post.category:
+        urls.append(f'/api/posts?category={post.category.slug}')
+    if post.tags:
+        urls.append(f'/api/posts?tag={post.tags[0].slug}')
+
+    failed = False
+    for url in urls:
+        response_cache.invalidate()
+        with count_queries(db.engine) as queries:
+            client.get(url)
+        scans = []
+        with db.engine.connect() as conn:
+            for statement, parameters in zip(queries.statements, queries.parameters):
+                if not statement.lstrip().upper().startswith('SELECT'):
+                    continue
+                for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+                    detail = row[-1]
+                    # "SCAN <table>" with no index; virtual tables and
+                    # subquery results are reported with more words, and
+                    # sqlite_ tables are SQLite's own schema
+                    if detail.startswith('SCAN ') and len(detail.split()) == 2 \
+                            and not detail.split()[1].startswith(('(', 'sqlite_')):
+                        scans.append(detail)
+        failed = failed or bool(scans)
+        click.echo(f"{'FAIL' if scans else 'ok'}\t{url}" + ''.join(f'\t{scan}' for scan in scans))
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('build-static')
+@click.option('--output', default=None, help='Site directory (default STATIC_SITE_DIR)')
+@click.option('--force', is_flag=True, help='Re-render every page, e.g. after a template change')
+def build_static(output, force):
+    """Render published posts, the blog index, sitemap and feeds to static files"""
+    site = StaticSite(output or app.config['STATIC_SITE_DIR'], app.config['SITE_URL'],
+                      upload_dir=app.config['UPLOAD_FOLDER'])
+    result = site.build(force=force)
+    click.echo(f"{result['posts']} published posts: {result['rendered']} rendered, "
+               f"{result['removed']} removed")
+    for slug in result['skipped']:
+        click.echo(f'Skipped {slug}: blogs/{slug}.html is a hand-written page; change the post slug', err=True)
+
+# First migration in migrations/versions, matching the original create_all schema
+INITIAL_REVISION = '2ecd8e0a1bbd'
+
+def upgrade_database():
+    """Apply pending migrations and create the search index"""
+    # Databases made with create_all before migrations existed already
+    # have the initial schema; record that so only later migrations run
+    tables = inspect(db.engine).get_table_names()
+    if 'post' in tables and 'alembic_version' not in tables:
+        stamp(revision=INITIAL_REVISION)
+    upgrade()
+    search_index.create()
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        upgrade_database()
     app.run(debug=True)
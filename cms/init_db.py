@@ -1,11 +1,11 @@
-from app import app, db
+from app import app, db, upgrade_database
 from models import User
 from werkzeug.security import generate_password_hash
 
 def init_db():
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        # Create or upgrade all tables
+        upgrade_database()
         
         # Check if admin user exists
         if not User.query.filter_by(email='admin@example.com').first():
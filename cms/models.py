@@ -2,6 +2,8 @@ from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from slugify import slugify
+from sqlalchemy.orm import validates
+from utils.search_index import plain_text
 
 db = SQLAlchemy()
 
@@ -38,14 +40,25 @@ class Tag(db.Model):
 
 post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_post_tags_tag_id', 'tag_id', 'post_id')
 )
 
 class Post(db.Model):
+    # Match the public API's filters, newest-first ordering and keyset cursor,
+    # and the admin listing's newest-first order over all posts
+    __table_args__ = (
+        db.Index('ix_post_created_at', 'created_at', 'id'),
+        db.Index('ix_post_published_created_at', 'published', 'created_at', 'id'),
+        db.Index('ix_post_category_published_created_at', 'category_id', 'published', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     slug = db.Column(db.String(200), unique=True, nullable=False)
     content = db.Column(db.Text, nullable=False)
+    # Content without its HTML markup, for the full-text index and snippets
+    search_text = db.Column(db.Text)
     excerpt = db.Column(db.Text)
     featured_image = db.Column(db.String(200))
     meta_description = db.Column(db.String(160))
@@ -55,7 +68,9 @@ class Post(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
-    tags = db.relationship('Tag', secondary=post_tags, lazy='subquery',
+    # Loaded on access; endpoints that need tags for many posts eager-load
+    # them with the options in serializers.py
+    tags = db.relationship('Tag', secondary=post_tags, lazy='select',
         backref=db.backref('posts', lazy=True))
     views = db.Column(db.Integer, default=0)
     share_count = db.Column(db.Integer, default=0)
@@ -65,15 +80,17 @@ class Post(db.Model):
             kwargs['slug'] = slugify(kwargs.get('title', ''))
         super().__init__(*args, **kwargs)
 
-    def increment_view(self):
-        self.views += 1
-        db.session.commit()
-
-    def increment_share(self):
-        self.share_count += 1
-        db.session.commit()
+    @validates('content')
+    def _set_search_text(self, key, content):
+        self.search_text = plain_text(content)
+        return content
 
 class Podcast(db.Model):
+    # Newest-first listings
+    __table_args__ = (
+        db.Index('ix_podcast_published_at', 'published_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -0,0 +1,44 @@
+from sqlalchemy.orm import joinedload, selectinload
+from models import Post
+
+
+def post_list_options():
+    """Loader options for serializing many posts in a fixed number of queries
+
+    Author and category are many-to-one, so they are joined into the post
+    query; tags are many-to-many and come from one extra IN query for the
+    whole page instead of one query per post.
+    """
+    return (
+        joinedload(Post.author),
+        joinedload(Post.category),
+        selectinload(Post.tags),
+    )
+
+
+def post_detail_options():
+    """Loader options for serializing a single post"""
+    return post_list_options()
+
+
+def serialize_post(post, detail=False):
+    """JSON-ready dict for a post; ``detail`` adds the full content"""
+    data = {
+        'id': post.id,
+        'title': post.title,
+        'featured_image': post.featured_image,
+        'author': post.author.username,
+        'category': post.category.name if post.category else None,
+        'tags': [tag.name for tag in post.tags],
+        'created_at': post.created_at.isoformat(),
+        'views': post.views,
+        'share_count': post.share_count
+    }
+    if detail:
+        data['content'] = post.content
+        data['updated_at'] = post.updated_at.isoformat()
+    else:
+        data['slug'] = post.slug
+        data['excerpt'] = post.excerpt
+    return data
+
@@ -0,0 +1,56 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Applied to every new SQLite connection. WAL lets readers in other gunicorn
+# workers carry on while one writes, and busy_timeout makes a writer wait
+# for the lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
+def database_uri(url, default='sqlite:///blog.db'):
+    """SQLAlchemy URI for a DATABASE_URL, accepting Heroku-style postgres:// URLs"""
+    if not url:
+        return default
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(uri, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800):
+    """Engine options for SQLALCHEMY_ENGINE_OPTIONS
+
+    Pool sizing applies per worker process. In-memory SQLite keeps
+    SQLAlchemy's single-connection pool, which takes no sizing.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+    }
+    if url.get_backend_name() != 'sqlite':
+        # Drop connections the server closed while they sat in the pool
+        options['pool_pre_ping'] = True
+    return options
+
+
+def configure_sqlite(engine, pragmas=None):
+    """Run the SQLite pragmas on each connection the engine opens; no-op elsewhere"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
@@ -0,0 +1,150 @@
+import math
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request
+
+# Response headers stored with the body so cache hits can still be revalidated
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+class LRUBackend:
+    """In-process cache of the most recently used responses
+
+    Each worker process has its own copy, so invalidation only reaches the
+    worker that handled the write; use it with a single worker or rely on
+    the timeout to bound staleness elsewhere.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Cache shared by every worker, stored in Redis
+
+    Keys carry a generation number kept in Redis, so clearing the cache is
+    a single INCR that every worker sees on its next lookup; stale entries
+    simply expire.
+    """
+
+    def __init__(self, url, prefix='cms:response'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, key):
+        generation = int(self.client.get(f'{self.prefix}:generation') or 0)
+        return f'{self.prefix}:{generation}:{key}'
+
+    def get(self, key):
+        value = self.client.get(self._key(key))
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, timeout):
+        self.client.set(self._key(key), pickle.dumps(value), ex=int(timeout))
+
+    def clear(self):
+        self.client.incr(f'{self.prefix}:generation')
+
+
+class ResponseCache:
+    """Caches whole responses of read-only views, keyed by path and query string
+
+    The backend is chosen with RESPONSE_CACHE_BACKEND: ``memory`` (default),
+    ``redis`` (shared across gunicorn workers, using
+    RESPONSE_CACHE_REDIS_URL) or ``none``. Views that change cached content
+    call :meth:`invalidate` after committing.
+    """
+
+    def __init__(self, app, backend=None):
+        self.app = app
+        self.timeout = app.config.get('RESPONSE_CACHE_TIMEOUT', 300)
+        self.backend = backend or self._make_backend(app.config)
+
+    @staticmethod
+    def _make_backend(config):
+        kind = config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        if kind == 'memory':
+            return LRUBackend(config.get('RESPONSE_CACHE_SIZE', 256))
+        if kind == 'redis':
+            return RedisBackend(config['RESPONSE_CACHE_REDIS_URL'])
+        if kind == 'none':
+            return None
+        raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {kind}')
+
+    @staticmethod
+    def _key():
+        return f'{request.path}?{sorted(request.args.items(multi=True))}'
+
+    def cached(self, view):
+        """Decorator serving a view from the cache when possible"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.backend is None:
+                return view(*args, **kwargs)
+            key = self._key()
+            hit = self.backend.get(key)
+            if hit is not None:
+                body, status, mimetype, headers = hit
+                response = self.app.response_class(body, status=status, mimetype=mimetype, headers=headers)
+                return response.make_conditional(request)
+            response = self.app.make_response(view(*args, **kwargs))
+            timeout = math.ceil(g.get('response_cache_timeout', self.timeout))
+            if response.status_code == 200 and not response.is_streamed and timeout > 0:
+                headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+                self.backend.set(key, (response.get_data(), response.status_code, response.mimetype, headers),
+                                 timeout)
+            return response
+        return wrapper
+
+    def memoize(self, key, compute):
+        """Return a cached value computed by ``compute()``, cleared with the responses"""
+        if self.backend is None:
+            return compute()
+        key = f'value:{key}'
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, self.timeout)
+        return value
+
+    def expire_within(self, seconds):
+        """Keep the current request's response for at most ``seconds``
+
+        For views whose output changes at a known time without any write,
+        such as when a scheduled item comes due.
+        """
+        g.response_cache_timeout = min(seconds, g.get('response_cache_timeout', self.timeout))
+
+    def invalidate(self):
+        """Drop every cached response and memoized value"""
+        if self.backend is not None:
+            self.backend.clear()
@@ -0,0 +1,189 @@
+import html
+import re
+from datetime import datetime
+from sqlalchemy import column, text
+
+# Private-use characters mark matches inside snippets, so the text around
+# them can be HTML-escaped before the markers become <mark> tags
+_OPEN, _CLOSE = '\ue000', '\ue001'
+
+# Tags, comments and script/style blocks; each becomes a space so the words
+# either side of a tag stay apart
+_MARKUP = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>', re.S | re.I)
+_SPACE = re.compile(r'\s+')
+
+# External-content FTS5 tables over post and podcast, kept in step by
+# triggers so every insert, update and delete is indexed incrementally,
+# whichever code path makes it. Posts are indexed from search_text, the
+# plain text of their HTML content, so markup is neither matched nor shown
+# in snippets.
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(
+        title, excerpt, search_text,
+        content='post', content_rowid='id', tokenize='porter unicode61', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, title, excerpt, search_text)
+        VALUES (new.id, new.title, new.excerpt, new.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, excerpt, search_text)
+        VALUES ('delete', old.id, old.title, old.excerpt, old.search_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS post_fts_update
+    AFTER UPDATE OF title, excerpt, search_text ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, title, excerpt, search_text)
+        VALUES ('delete', old.id, old.title, old.excerpt, old.search_text);
+        INSERT INTO post_fts(rowid, title, excerpt, search_text)
+        VALUES (new.id, new.title, new.excerpt, new.search_text);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS podcast_fts USING fts5(
+        title, description,
+        content='podcast', content_rowid='id', tokenize='porter unicode61', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS podcast_fts_insert AFTER INSERT ON podcast BEGIN
+        INSERT INTO podcast_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS podcast_fts_delete AFTER DELETE ON podcast BEGIN
+        INSERT INTO podcast_fts(podcast_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS podcast_fts_update
+    AFTER UPDATE OF title, description ON podcast BEGIN
+        INSERT INTO podcast_fts(podcast_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO podcast_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+# Ordering by FTS5's own rank column (rather than a bm25() expression) lets
+# the index hand back only the best rows, so highlight() and snippet() run
+# for the page instead of every match. Title matches weigh most, then
+# excerpts, then body text.
+POST_SEARCH = f"""
+    SELECT post.id, post.slug, post.created_at, post_fts.rank AS score,
+           highlight(post_fts, 0, '{_OPEN}', '{_CLOSE}') AS title,
+           snippet(post_fts, -1, '{_OPEN}', '{_CLOSE}', '…', :words) AS snippet
+    FROM post_fts JOIN post ON post.id = post_fts.rowid
+    WHERE post_fts MATCH :query AND post_fts.rank MATCH 'bm25(10.0, 4.0, 1.0)'
+      AND post.published = 1
+    ORDER BY post_fts.rank LIMIT :limit"""
+
+PODCAST_SEARCH = f"""
+    SELECT podcast.id, podcast.audio_file, podcast.published_at, podcast_fts.rank AS score,
+           highlight(podcast_fts, 0, '{_OPEN}', '{_CLOSE}') AS title,
+           snippet(podcast_fts, 1, '{_OPEN}', '{_CLOSE}', '…', :words) AS snippet
+    FROM podcast_fts JOIN podcast ON podcast.id = podcast_fts.rowid
+    WHERE podcast_fts MATCH :query AND podcast_fts.rank MATCH 'bm25(10.0, 1.0)'
+      AND podcast.published_at IS NOT NULL AND podcast.published_at <= :now
+    ORDER BY podcast_fts.rank LIMIT :limit"""
+
+
+def plain_text(markup):
+    """Text of an HTML fragment, with tags, scripts and comments removed"""
+    if markup is None:
+        return None
+    return _SPACE.sub(' ', html.unescape(_MARKUP.sub(' ', markup))).strip()
+
+
+def match_query(terms):
+    """FTS5 query matching every word of free text, the last one as a prefix
+
+    Each word is quoted, so operators and punctuation in user input are
+    searched for literally instead of being parsed as FTS5 syntax.
+    """
+    words = [word.replace('"', '""') for word in terms.split()]
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def _isoformat(value):
+    # Raw SQL returns SQLite's stored text rather than a datetime
+    return datetime.fromisoformat(value).isoformat() if value else None
+
+
+def _highlighted(value):
+    return html.escape(value or '').replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+class SearchIndex:
+    """Ranked full-text search over posts and podcasts using SQLite FTS5
+
+    The index lives in the CMS database next to the tables it covers.
+    :meth:`create` sets it up, indexing existing rows, and is safe to
+    repeat; :meth:`rebuild` reindexes every row. On other databases, or
+    before the index has been created, :attr:`available` is false and
+    callers fall back to LIKE matching.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._available = None
+
+    @property
+    def available(self):
+        if self._available is None:
+            engine = self.db.engine
+            self._available = engine.dialect.name == 'sqlite' and bool(self.db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")
+            ).scalar())
+        return self._available
+
+    def create(self):
+        if self.db.engine.dialect.name != 'sqlite':
+            return False
+        with self.db.engine.begin() as conn:
+            existing = set(conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('post_fts', 'podcast_fts')"
+            )).scalars())
+            for statement in SCHEMA:
+                conn.execute(text(statement))
+            # A new index starts empty; fill it from rows already there
+            for table in ('post_fts', 'podcast_fts'):
+                if table not in existing:
+                    conn.execute(text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+        self._available = None
+        return True
+
+    def rebuild(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO post_fts(post_fts) VALUES ('rebuild')"))
+            conn.execute(text("INSERT INTO podcast_fts(podcast_fts) VALUES ('rebuild')"))
+
+    def post_ids(self, query):
+        """Select of ids of posts matching ``query``, for filtering other queries"""
+        return text('SELECT rowid FROM post_fts WHERE post_fts MATCH :search_query') \
+            .bindparams(search_query=query).columns(column('rowid'))
+
+    def search(self, terms, limit=20, snippet_words=16, now=None):
+        """Best-ranked published posts and podcasts for free text
+
+        Results carry an HTML-escaped ``title`` and ``snippet`` with the
+        matched words wrapped in ``<mark>``.
+        """
+        query = match_query(terms)
+        if query is None:
+            return {'posts': [], 'podcasts': []}
+        params = {'query': query, 'limit': limit, 'words': snippet_words}
+        posts = self.db.session.execute(text(POST_SEARCH), params).mappings()
+        now = (now or datetime.utcnow()).isoformat(' ')
+        podcasts = self.db.session.execute(text(PODCAST_SEARCH), dict(params, now=now)).mappings()
+        return {
+            'posts': [{
+                'id': row['id'],
+                'slug': row['slug'],
+                'title': _highlighted(row['title']),
+                'snippet': _highlighted(row['snippet']),
+                'score': -row['score'],
+                'created_at': _isoformat(row['created_at']),
+            } for row in posts],
+            'podcasts': [{
+                'id': row['id'],
+                'audio_file': row['audio_file'],
+                'title': _highlighted(row['title']),
+                'snippet': _highlighted(row['snippet']),
+                'score': -row['score'],
+                'published_at': _isoformat(row['published_at']),
+            } for row in podcasts],
+        }
@@ -0,0 +1,198 @@
+import html
+import json
+import os
+import re
+import shutil
+from datetime import datetime
+from flask import render_template
+from sqlalchemy.orm import joinedload, load_only
+from models import Post, Category, User
+from serializers import post_detail_options
+
+MANIFEST = '.build-manifest.json'
+# Written into every rendered post page, so a build can tell its own pages
+# from hand-written ones even if an earlier build stopped before saving
+# the manifest
+GENERATOR = 'Spirit of the Deal CMS'
+
+# Hand-written pages in blogs/ have no database row; these pick out what
+# the index and sitemap need from their HTML
+_H1 = re.compile(r'<h1[^>]*>(.*?)</h1>', re.S)
+_DESCRIPTION = re.compile(r'<meta name="description" content="([^"]*)"')
+_PARAGRAPH = re.compile(r'<p>(.*?)</p>', re.S)
+_DATE = re.compile(r'<span class="date">([^<]+)</span>')
+_TAGS = re.compile(r'<[^>]+>')
+
+
+def _write(path, content):
+    # Readers never see a half-written page
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def _is_generated(source):
+    return f'<meta name="generator" content="{GENERATOR}">' in source
+
+
+def _text(fragment):
+    return html.unescape(_TAGS.sub('', fragment)).strip()
+
+
+class StaticSite:
+    """Renders published posts into the static site served from ``output_dir``
+
+    Each post becomes ``blogs/<slug>.html``. A manifest beside them records
+    the ``updated_at`` each page was rendered from, so a build only
+    re-renders posts that changed since and removes pages of posts that were
+    deleted, unpublished or renamed. Hand-written pages share the directory:
+    a post whose slug names one of them is skipped rather than overwriting
+    it, and only pages a build rendered are ever removed.
+    ``blogs/index.html``, ``sitemap.xml`` and the RSS and Atom feeds are
+    rewritten whenever any post page changes.
+    """
+
+    def __init__(self, output_dir, site_url, upload_dir=None, batch_size=100):
+        self.output_dir = output_dir
+        self.blog_dir = os.path.join(output_dir, 'blogs')
+        self.site_url = site_url.rstrip('/')
+        self.upload_dir = upload_dir
+        self.batch_size = batch_size
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.blog_dir, MANIFEST), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _posts(self):
+        # Everything the index, sitemap and feeds show; content is only
+        # loaded for the posts being re-rendered
+        return Post.query.options(
+            load_only(Post.id, Post.title, Post.slug, Post.excerpt, Post.featured_image,
+                      Post.meta_description, Post.created_at, Post.updated_at),
+            joinedload(Post.author).load_only(User.username),
+            joinedload(Post.category).load_only(Category.name)
+        ).filter_by(published=True).order_by(Post.created_at.desc(), Post.id.desc()).all()
+
+    def _clashes(self, name, owned):
+        """Whether a post page called ``name`` would replace a hand-written page"""
+        if name == 'index.html':
+            return True
+        if name in owned:
+            return False
+        try:
+            with open(os.path.join(self.blog_dir, name), encoding='utf-8') as f:
+                return not _is_generated(f.read())
+        except FileNotFoundError:
+            return False
+
+    def _unlisted_pages(self, owned):
+        """Rendered pages the manifest lost track of, e.g. after an interrupted build"""
+        names = []
+        for name in os.listdir(self.blog_dir):
+            if name.endswith('.html') and name != 'index.html' and name not in owned:
+                with open(os.path.join(self.blog_dir, name), encoding='utf-8') as f:
+                    if _is_generated(f.read()):
+                        names.append(name)
+        return names
+
+    def _hand_written_pages(self, generated):
+        """Pages in blogs/ that were not produced by a build"""
+        pages = []
+        for name in sorted(os.listdir(self.blog_dir)):
+            if not name.endswith('.html') or name == 'index.html' or name in generated:
+                continue
+            with open(os.path.join(self.blog_dir, name), encoding='utf-8') as f:
+                source = f.read()
+            title = _H1.search(source)
+            if title is None or _is_generated(source):
+                continue
+            description = _DESCRIPTION.search(source) or _PARAGRAPH.search(source)
+            date = _DATE.search(source)
+            try:
+                date = datetime.strptime(date.group(1).strip(), '%B %d, %Y') if date else None
+            except ValueError:
+                date = None
+            pages.append({
+                'file': name,
+                'title': _text(title.group(1)),
+                'description': _text(description.group(1)) if description else '',
+                'date': date,
+            })
+        return pages
+
+    def _copy_image(self, filename):
+        if not filename or not self.upload_dir:
+            return
+        source = os.path.join(self.upload_dir, filename)
+        target = os.path.join(self.blog_dir, 'images', filename)
+        if os.path.exists(source) and (not os.path.exists(target)
+                                       or os.path.getmtime(target) < os.path.getmtime(source)):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+
+    def build(self, force=False):
+        """Bring the output up to date; returns page counts and the slugs skipped"""
+        os.makedirs(self.blog_dir, exist_ok=True)
+        previous = self._load_manifest()
+        posts = self._posts()
+
+        owned = {entry['file'] for entry in previous.values()}
+        manifest = {}
+        stale = []
+        skipped = []
+        for post in posts:
+            entry = {'file': f'{post.slug}.html', 'updated_at': post.updated_at.isoformat()}
+            if self._clashes(entry['file'], owned):
+                skipped.append(post)
+                continue
+            manifest[str(post.id)] = entry
+            if force or previous.get(str(post.id)) != entry \
+                    or not os.path.exists(os.path.join(self.blog_dir, entry['file'])):
+                stale.append(post.id)
+
+        posts = [post for post in posts if post not in skipped]
+
+        # Pages whose post is gone, unpublished or now lives at another slug,
+        # including ones an interrupted build rendered but never recorded
+        current_files = {entry['file'] for entry in manifest.values()}
+        removed = [entry['file'] for entry in previous.values() if entry['file'] not in current_files]
+        removed += [name for name in self._unlisted_pages(owned) if name not in current_files]
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.blog_dir, name))
+            except FileNotFoundError:
+                pass
+
+        for start in range(0, len(stale), self.batch_size):
+            batch = Post.query.options(*post_detail_options()) \
+                .filter(Post.id.in_(stale[start:start + self.batch_size])).all()
+            for post in batch:
+                self._copy_image(post.featured_image)
+                _write(os.path.join(self.blog_dir, f'{post.slug}.html'),
+                       render_template('site/post.html', post=post, site_url=self.site_url,
+                                       generator=GENERATOR))
+
+        indexes = ['index.html', 'feed.xml', 'atom.xml']
+        if force or stale or removed or previous.keys() != manifest.keys() \
+                or not all(os.path.exists(os.path.join(self.blog_dir, name)) for name in indexes):
+            pages = self._hand_written_pages(current_files)
+            top_level = sorted(name for name in os.listdir(self.output_dir) if name.endswith('.html'))
+            context = {
+                'posts': posts,
+                'pages': pages,
+                'top_level': top_level,
+                'site_url': self.site_url,
+                'built_at': datetime.utcnow(),
+            }
+            _write(os.path.join(self.blog_dir, 'index.html'), render_template('site/index.html', **context))
+            _write(os.path.join(self.blog_dir, 'feed.xml'), render_template('site/feed.xml', **context))
+            _write(os.path.join(self.blog_dir, 'atom.xml'), render_template('site/atom.xml', **context))
+            _write(os.path.join(self.output_dir, 'sitemap.xml'), render_template('site/sitemap.xml', **context))
+
+        _write(os.path.join(self.blog_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True))
+        return {'posts': len(posts), 'rendered': len(stale), 'removed': len(removed),
+                'skipped': [post.slug for post in skipped]}
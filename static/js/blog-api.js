@@ -109,7 +109,6 @@ class BlogUI {
             });
 
             this.renderPosts(posts, options.append);
-            this.updatePagination(posts.total);
         } catch (error) {
             this.showError('Failed to load posts');
         } finally {
@@ -127,7 +126,7 @@ class BlogUI {
             container.appendChild(this.createPostCard(post));
         });
 
-        this.updateLoadMoreButton(posts.total);
+        this.updateLoadMoreButton(posts.meta.total);
     }
 
     createPostCard(post) {